@@ -0,0 +1,175 @@
+# File: base_node.py
+# Instrumentation shared by all ComfySnap nodes: stage timings, a metrics registry and rate-limited logging
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+class MetricsRegistry:
+    """
+    A thread-safe, process-wide record of per-node, per-stage work.
+
+    Every (node, stage) pair keeps the number of calls, the total and maximum wall-clock seconds
+    and the bytes allocated. Timings are measured on the host, so on a GPU they include only
+    the work that had to finish before the stage returned.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def record(self, node, stage, seconds, nbytes=0):
+        """Adds one timed call of a stage."""
+        with self._lock:
+            entry = self._stages.get((node, stage))
+            if entry is None:
+                entry = self._stages[(node, stage)] = {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "bytes": 0}
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            entry["bytes"] += int(nbytes)
+
+    def snapshot(self, node=None):
+        """
+        Returns a copy of the counters.
+
+        Args:
+            node (str, optional): Only this node's stages.
+
+        Returns:
+            dict: {node: {stage: {"calls", "seconds", "max_seconds", "bytes"}}}
+        """
+        with self._lock:
+            result = {}
+            for (node_name, stage), entry in sorted(self._stages.items()):
+                if node is None or node_name == node:
+                    result.setdefault(node_name, {})[stage] = dict(entry)
+            return result
+
+    def reset(self):
+        """Drops all counters."""
+        with self._lock:
+            self._stages.clear()
+
+    def to_json(self, indent=None):
+        """The snapshot as a JSON document."""
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def to_prometheus(self, prefix="comfysnap"):
+        """The snapshot in the Prometheus text exposition format."""
+        series = [("stage_calls_total", "counter", "calls"), ("stage_seconds_total", "counter", "seconds"),
+                  ("stage_seconds_max", "gauge", "max_seconds"), ("stage_bytes_total", "counter", "bytes")]
+        snapshot = self.snapshot(); lines = []
+        for name, kind, field in series:
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for node, stages in snapshot.items():
+                for stage, entry in stages.items():
+                    lines.append(f'{prefix}_{name}{{node="{node}",stage="{stage}"}} {entry[field]}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path, fmt="json"):
+        """Writes the snapshot to path as "json" or "prometheus" text."""
+        if fmt not in ("json", "prometheus"):
+            raise ValueError(f"Invalid metrics format '{fmt}'. Valid options are: ['json', 'prometheus'].")
+        with open(path, "w") as handle:
+            handle.write(self.to_json(indent=1) if fmt == "json" else self.to_prometheus())
+
+
+METRICS = MetricsRegistry()
+
+
+class StageRecord:
+    """Yielded by timed_stage(); add to nbytes for allocations only known inside the block."""
+    __slots__ = ("nbytes",)
+
+    def __init__(self, nbytes=0):
+        self.nbytes = nbytes
+
+
+@contextmanager
+def timed_stage(node, stage, nbytes=0):
+    """Times the enclosed block and records it, with the bytes it allocated, in METRICS under (node, stage)."""
+    record = StageRecord(nbytes)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        METRICS.record(node, stage, time.perf_counter() - start, record.nbytes)
+
+
+class RateLimitedLogger:
+    """
+    Structured logging that emits each event at most once per interval.
+
+    Repeats inside the interval are counted and reported with the next emitted record of that
+    event, so a message hit on every frame costs a dictionary lookup instead of a write.
+
+    Args:
+        logger (logging.Logger): Destination logger.
+        interval (float): Minimum seconds between two records of the same event.
+    """
+    def __init__(self, logger, interval=60.0):
+        self.logger = logger
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last = {}
+        self._suppressed = {}
+
+    def log(self, level, event, message, **fields):
+        """Logs message under an event key with key=value fields, unless the event was logged within interval."""
+        if not self.logger.isEnabledFor(level): return
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(event)
+            if last is not None and now - last < self.interval:
+                self._suppressed[event] = self._suppressed.get(event, 0) + 1
+                return
+            self._last[event] = now
+            suppressed = self._suppressed.pop(event, 0)
+        if suppressed: fields["suppressed"] = suppressed
+        details = " ".join(f"{key}={value!r}" for key, value in fields.items())
+        self.logger.log(level, f"{message} [{event}{' ' + details if details else ''}]",
+                        extra={"event": event, "fields": fields})
+
+    def error(self, event, message, **fields): self.log(logging.ERROR, event, message, **fields)
+    def warning(self, event, message, **fields): self.log(logging.WARNING, event, message, **fields)
+    def info(self, event, message, **fields): self.log(logging.INFO, event, message, **fields)
+
+
+_loggers = {}
+_loggers_lock = threading.Lock()
+
+def get_logger(name, interval=60.0):
+    """Returns the shared RateLimitedLogger for a logger name."""
+    with _loggers_lock:
+        if name not in _loggers: _loggers[name] = RateLimitedLogger(logging.getLogger(name), interval)
+        return _loggers[name]
+
+
+# Add a base node class for standardizing input/output handling
+class BaseNode:
+    """
+    Base class of the ComfySnap nodes: rate-limited structured logging and stage timings
+    recorded under the node's class name in METRICS.
+    """
+    def __init__(self):
+        self.logger = get_logger(f"ComfySnap.{self.__class__.__name__}")
+
+    def log_error(self, message, event=None, **fields):
+        self.logger.error(event or message, message, **fields)
+
+    def log_warning(self, message, event=None, **fields):
+        self.logger.warning(event or message, message, **fields)
+
+    def log_info(self, message, event=None, **fields):
+        self.logger.info(event or message, message, **fields)
+
+    def stage(self, name, nbytes=0):
+        """Context manager timing one stage of this node (see timed_stage())."""
+        return timed_stage(self.__class__.__name__, name, nbytes)
+
+    @classmethod
+    def metrics(cls):
+        """This node's stage counters from METRICS."""
+        return METRICS.snapshot(cls.__name__).get(cls.__name__, {})
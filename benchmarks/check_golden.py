@@ -0,0 +1,230 @@
+# File: benchmarks/check_golden.py
+"""
+Checks node outputs against golden checksums so faster code paths can be verified for numerical drift.
+
+    python benchmarks/check_golden.py             # compare against benchmarks/golden.json
+    python benchmarks/check_golden.py --update    # record the current outputs as the new goldens
+
+Every case runs on a small fixed synthetic batch. Image outputs are compared by a SHA-256 of their
+8-bit levels. When a checksum differs, the batch's 8x8 average-pooled thumbnail shows how far the
+output moved: within --max-drift levels it is reported as drift, beyond that as a mismatch (exit code 1).
+Outputs depend on library versions (Pillow's JPEG codec and default font, torch kernels), so the
+environment that recorded the goldens is stored alongside them.
+
+The goldens only pin the current code. The filters and effects are also compared against a copy of the
+original per-frame Pillow implementation embedded below: the filters' "pil_compatible" cases must
+reproduce it level for level, and the tensor paths may move its thumbnail by at most --max-reference-drift
+levels. The effects' noise is left out of that comparison, as it is seeded per frame now rather than
+drawn from the global NumPy stream. Captions assembled from the glyph atlas must match PIL's own text
+renderer pixel for pixel.
+
+Finally every case is run on the CPU with utils.pil_transfer_stats() counting the batches that cross the
+tensor/PIL boundary: a call may cross it at most once in each direction, whatever the batch size, so any
+per-frame round trip fails the check.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+
+import numpy as np
+import torch
+from PIL import Image, ImageEnhance, ImageOps
+
+import common
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden.json")
+BATCH_SIZE, HEIGHT, WIDTH = 3, 72, 100
+
+
+def reference_filter(image, filter_type, strength):
+    """The original SnapBasicFilters: every frame through ImageOps/ImageEnhance/alpha_composite, then Image.blend."""
+    output_images = []
+    for i in range(image.shape[0]):
+        img_pil_rgb = Image.fromarray((image[i].cpu().numpy() * 255).astype(np.uint8)).convert('RGB')
+        original_img_pil = img_pil_rgb.copy(); filtered_img_pil = img_pil_rgb
+        if filter_type == "grayscale":
+            filtered_img_pil = ImageOps.grayscale(img_pil_rgb).convert('RGB')
+        elif filter_type == "vivid":
+            filtered_img_pil = ImageEnhance.Contrast(filtered_img_pil).enhance(1.3)
+            filtered_img_pil = ImageEnhance.Color(filtered_img_pil).enhance(1.3)
+        elif filter_type == "cooler":
+            blue_tint = Image.new("RGBA", filtered_img_pil.size, (120, 150, 255, 30))
+            filtered_img_pil = Image.alpha_composite(filtered_img_pil.convert("RGBA"), blue_tint).convert("RGB")
+        elif filter_type == "warmer":
+            orange_tint = Image.new("RGBA", filtered_img_pil.size, (255, 180, 100, 30))
+            filtered_img_pil = Image.alpha_composite(filtered_img_pil.convert("RGBA"), orange_tint).convert("RGB")
+        elif filter_type == "brighter":
+            filtered_img_pil = ImageEnhance.Brightness(filtered_img_pil).enhance(1.25)
+        elif filter_type == "darker":
+            filtered_img_pil = ImageEnhance.Brightness(filtered_img_pil).enhance(0.8)
+            filtered_img_pil = ImageEnhance.Contrast(filtered_img_pil).enhance(1.1)
+        final_img_pil = Image.blend(original_img_pil, filtered_img_pil, strength)
+        output_images.append(torch.from_numpy(np.array(final_img_pil).astype(np.float32) / 255.0))
+    return torch.stack(output_images)
+
+
+def reference_effects(image, params):
+    """The original LowQualityDigitalLook without its noise step: ImageEnhance color and brightness, then a JPEG round trip."""
+    output_images = []
+    for i in range(image.shape[0]):
+        processed_pil = Image.fromarray((image[i].cpu().numpy() * 255).astype(np.uint8)).convert('RGB')
+        if abs(params["saturation"] - 1.0) > 0.01: processed_pil = ImageEnhance.Color(processed_pil).enhance(params["saturation"])
+        if abs(params["brightness"] - 1.0) > 0.01: processed_pil = ImageEnhance.Brightness(processed_pil).enhance(params["brightness"])
+        if params["jpeg_quality"] < 98:
+            buffer = io.BytesIO()
+            processed_pil.save(buffer, format="JPEG", quality=params["jpeg_quality"], subsampling=params["jpeg_subsampling"])
+            buffer.seek(0); processed_pil = Image.open(buffer).convert('RGB')
+        output_images.append(torch.from_numpy(np.array(processed_pil).astype(np.float32) / 255.0))
+    return torch.stack(output_images)
+
+
+def reference_cases(font_name="arial.ttf"):
+    """
+    Pairs of current and original implementations, and of the glyph atlas and PIL's text renderer.
+
+    Returns:
+        list: dicts with "name", "run" and "reference" (input tensor -> image tensor) and "exact"
+        (True when the outputs must be identical rather than within drift).
+    """
+    filters = common.node_module("snap_filters").SnapBasicFilters
+    effects = common.node_module("snap_effects").LowQualityDigitalLook
+    cases = []
+    for filter_type in [f for f in filters.FILTER_TYPES if f != "original"]:
+        for precision in filters.PRECISION_MODES:
+            cases.append({"name": f"reference/filters/{filter_type}/{precision}", "exact": precision == "pil_compatible",
+                          "run": lambda x, f=filter_type, p=precision: filters().execute(x, f, 0.8, False, False, 0, 0.5, 1.0, p)[0],
+                          "reference": lambda x, f=filter_type: reference_filter(x, f, 0.8)})
+
+    def effects_without_noise(x, params, backend):
+        y = effects.apply_color(x[..., :3].to(torch.float32).clamp(0.0, 1.0), params)
+        return effects.apply_jpeg(y, params["jpeg_quality"], params["jpeg_subsampling"], backend)
+    for preset in effects.PRESET_MODES:
+        params = effects.resolve_params(preset, 0.5)
+        for backend in effects.JPEG_BACKENDS:
+            cases.append({"name": f"reference/effects/{preset}/{backend}", "exact": False,
+                          "run": lambda x, p=params, b=backend: effects_without_noise(x, p, b),
+                          "reference": lambda x, p=params: reference_effects(x, p)})
+
+    text_node = common.node_module("snap_text").SnapTextOverlay()
+    LRUCache = common.node_module("utils").LRUCache
+
+    def overlay(x, text, renderer):
+        out = x.clone()
+        text_node.overlay_into(out, text, font_name, 0.08, 0.7, 4, "bottom", 0.0, "#FFFFFF", "#000000", 0.5,
+                               renderer=renderer, sprite_cache=LRUCache(64))
+        return out
+    for length, text in common.TEXT_LENGTHS.items():
+        cases.append({"name": f"reference/text/atlas/{length}", "exact": True,
+                      "run": lambda x, t=text: overlay(x, t, "atlas"), "reference": lambda x, t=text: overlay(x, t, "pil")})
+    return cases
+
+
+def compare_reference(case, data, max_drift):
+    """Returns ("match" | "drift" | "MISMATCH", detail) for one current/original pair."""
+    current = case["run"](data); reference = case["reference"](data)
+    if common.image_checksum(current) == common.image_checksum(reference): return "match", ""
+    diff = max(abs(a - b) for a, b in zip(common.image_thumbnail(current), common.image_thumbnail(reference)))
+    levels = (current.cpu() - reference).abs().mul(255.0).mean().item()
+    detail = f"thumbnail moved by up to {diff:.3f} levels, {levels:.3f} levels per pixel on average"
+    if case["exact"]: return "MISMATCH", f"expected identical output; {detail}"
+    return ("MISMATCH" if diff > max_drift else "drift"), detail
+
+
+def check_transfers(case, data):
+    """
+    Returns None if a case crosses the tensor/PIL boundary at most once in each direction per call,
+    independently of the batch size, or a description of the transfers it made otherwise.
+    The case runs once to warm its caches, then on data and on data repeated to twice the frames.
+    """
+    utils = common.node_module("utils")
+    case["run"](data)
+    counts = []
+    for batch in (data, torch.cat([data, data])):
+        utils.pil_transfer_stats(reset=True)
+        case["run"](batch)
+        counts.append(utils.pil_transfer_stats(reset=True))
+    if counts[0] == counts[1] and all(count <= 1 for count in counts[0].values()): return None
+    return f"{counts[0]} for {data.shape[0]} frames, {counts[1]} for {2 * data.shape[0]}"
+
+
+def record(case, data):
+    """Summarizes one case's outputs: checksum and thumbnail for images, rounded values otherwise."""
+    entries = []
+    for output in case["run"](data):
+        if isinstance(output, torch.Tensor) and output.dim() == 4:
+            entries.append({"checksum": common.image_checksum(output), "thumbnail": common.image_thumbnail(output)})
+        else:
+            values = output if isinstance(output, (list, tuple)) else [output]
+            entries.append({"values": [round(v, 6) if isinstance(v, float) else v for v in values]})
+    return entries
+
+
+def compare_case(name, golden, current, max_drift):
+    """Returns ("match" | "drift" | "MISMATCH", detail) for one case."""
+    if len(golden) != len(current): return "MISMATCH", f"{len(current)} outputs, expected {len(golden)}"
+    worst = 0.0
+    for expected, actual in zip(golden, current):
+        if "checksum" in expected:
+            if expected["checksum"] == actual.get("checksum"): continue
+            diff = max(abs(a - b) for a, b in zip(expected["thumbnail"], actual["thumbnail"]))
+            worst = max(worst, diff)
+            if diff > max_drift: return "MISMATCH", f"thumbnail moved by up to {diff:.3f} levels"
+        elif any(not isinstance(a, float) and a != b or isinstance(a, float) and abs(a - b) > 1e-6
+                 for a, b in zip(expected["values"], actual.get("values", []))):
+            return "MISMATCH", f"values {actual.get('values')} != {expected['values']}"
+    return ("match", "") if worst == 0.0 and all(e == a for e, a in zip(golden, current)) else ("drift", f"up to {worst:.3f} levels")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--golden", default=GOLDEN_PATH, help="Golden file to compare against or write.")
+    parser.add_argument("--update", action="store_true", help="Record the current outputs instead of comparing.")
+    parser.add_argument("--font", default="arial.ttf", help="Font for the text cases (part of the recorded environment).")
+    parser.add_argument("--max-drift", type=float, default=0.5, help="Thumbnail difference in 8-bit levels still accepted as drift.")
+    parser.add_argument("--max-reference-drift", type=float, default=2.5,
+                        help="Thumbnail difference from the original Pillow implementation accepted for the tensor paths.")
+    args = parser.parse_args(argv)
+
+    image = common.synthetic_batch(BATCH_SIZE, HEIGHT, WIDTH, seed=1234)
+    masks = common.synthetic_masks(BATCH_SIZE, HEIGHT, WIDTH)
+    cases = common.node_cases(args.font, precisions=("float", "pil_compatible"))
+    current = {case["name"]: record(case, masks if case["input"] == "mask" else image) for case in cases}
+    environment = dict(common.environment(), font=args.font)
+
+    if args.update:
+        with open(args.golden, "w") as handle:
+            json.dump({"environment": environment, "input": [BATCH_SIZE, HEIGHT, WIDTH], "cases": current}, handle, indent=1)
+        print(f"Recorded {len(current)} cases to {args.golden}")
+        return 0
+
+    with open(args.golden) as handle: golden = json.load(handle)
+    for key in ("torch", "pillow", "numpy", "font"):
+        if golden["environment"].get(key) != environment.get(key):
+            print(f"note: goldens were recorded with {key} {golden['environment'].get(key)}, running {environment.get(key)}")
+    failures = 0
+    for name, outputs in current.items():
+        if name not in golden["cases"]:
+            print(f"{name:<52} new case (not in goldens)"); continue
+        status, detail = compare_case(name, golden["cases"][name], outputs, args.max_drift)
+        failures += status == "MISMATCH"
+        print(f"{name:<52} {status} {detail}".rstrip())
+    for case in reference_cases(args.font):
+        status, detail = compare_reference(case, image, args.max_reference_drift)
+        failures += status == "MISMATCH"
+        print(f"{case['name']:<52} {status} {detail}".rstrip())
+    transfer_failures = 0
+    for case in cases:
+        detail = check_transfers(case, masks if case["input"] == "mask" else image)
+        if detail is not None:
+            transfer_failures += 1
+            print(f"{'transfers/' + case['name']:<52} MISMATCH per-frame tensor/PIL transfers: {detail}")
+    print(f"{'transfers':<52} {'MISMATCH' if transfer_failures else 'match'} {len(cases) - transfer_failures}/{len(cases)} cases "
+          f"cross the tensor/PIL boundary at most once per direction and call")
+    failures += transfer_failures
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
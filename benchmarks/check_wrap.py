@@ -0,0 +1,110 @@
+# File: benchmarks/check_wrap.py
+"""
+Checks SnapTextOverlay.wrap_text_pixel_width against the original word-by-word implementation.
+
+    python benchmarks/check_wrap.py                        # PIL's default font (Pillow >= 10.1)
+    python benchmarks/check_wrap.py --font /path/to/font.ttf --sizes 12,24,48
+
+Every caption of a fixed multilingual corpus is wrapped at a range of widths and font sizes by
+both implementations; any difference in the line breaks is printed and fails the check (exit
+code 1). The total time of each implementation is reported alongside. Before Pillow 10.1 the
+default font is a fixed-size bitmap font, so --font is required there.
+"""
+import argparse
+import sys
+import time
+
+import PIL
+from PIL import Image, ImageDraw, ImageFont
+
+import common
+
+CORPUS = [
+    common.SHORT_TEXT, common.MEDIUM_TEXT, common.LONG_TEXT,
+    "Quand le métro s'arrête entre deux stations, tout le monde fait semblant de lire son téléphone.",
+    "Die Donaudampfschifffahrtsgesellschaftskapitänsmütze lag natürlich genau dort, wo sie niemand suchte.",
+    "¿Por qué siempre llueve justo cuando decido no llevar paraguas? Misterios de la vida cotidiana.",
+    "Zażółć gęślą jaźń, powiedział nauczyciel, i cała klasa wybuchnęła śmiechem bez żadnego powodu.",
+    "Όταν το καφενείο κλείνει νωρίς, η γειτονιά ξαφνικά μοιάζει πολύ πιο ήσυχη απ' ό,τι θυμόμουν.",
+    "Когда кот садится на клавиатуру, письмо начальнику внезапно становится гораздо интереснее.",
+    "Tôi đã đợi xe buýt suốt bốn mươi phút, rồi hai chiếc đến cùng một lúc như thể đã hẹn trước.",
+    "今日は朝から雨が降っていたので、駅まで走ったのに電車はもう出発していました。",
+    "check https://example.com/a/very/long/path/that/keeps/going/and/going?with=query&strings=too before it expires",
+    "pneumonoultramicroscopicsilicovolcanoconiosis",
+    "  leading and   repeated   spaces,\ttabs\tinside words and trailing spaces   ",
+    "first paragraph\n\nsecond paragraph after a blank line\n   \nthird one",
+    "emoji 😂😂😂 in the middle of a caption 🎉 and at the end 🙃",
+    "a b c d e f g h i j k l m n o p q r s t u v w x y z " * 4,
+    "WWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWW iiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiii",
+]
+WIDTHS = [8, 20, 45, 80, 120, 200, 320, 480, 700, 1000]
+# ImageFont.load_default(size) returns a scalable FreeType font from Pillow 10.1 on
+SCALABLE_DEFAULT_FONT = tuple(int(part) for part in PIL.__version__.split(".")[:2]) >= (10, 1)
+
+
+def legacy_wrap_text_pixel_width(draw, text, font, max_width):
+    """The original implementation: measures the whole growing line with textbbox after every word."""
+    def text_width(line):
+        bbox = draw.textbbox((0, 0), line, font=font, anchor="lt"); return bbox[2] - bbox[0]
+    lines = [];
+    if not text or max_width <= 0 or not hasattr(font, 'size'): return lines
+    paragraphs = text.split('\n'); all_lines = []
+    for paragraph in paragraphs:
+        if not paragraph.strip(): all_lines.append(""); continue
+        words = paragraph.split(' '); current_line = ""
+        for word in words:
+            word = word.strip();
+            if not word: continue
+            test_line = current_line + (" " if current_line else "") + word; line_width = 0
+            try: line_width = text_width(test_line)
+            except Exception as e: line_width = len(test_line) * font.size * 0.6
+            if line_width <= max_width: current_line = test_line
+            else:
+                if current_line: all_lines.append(current_line)
+                try: current_word_width = text_width(word)
+                except: current_word_width = len(word) * font.size * 0.6
+                if current_word_width > max_width:
+                    temp_word = "";
+                    for i, char in enumerate(word):
+                         try: current_width = text_width(temp_word + char)
+                         except: current_width = len(temp_word + char) * font.size * 0.6
+                         if current_width > max_width and temp_word: all_lines.append(temp_word); temp_word = char
+                         else: temp_word += char
+                    current_line = temp_word
+                else: current_line = word
+        if current_line: all_lines.append(current_line)
+    return all_lines
+
+
+def load(font_name, size):
+    return ImageFont.load_default(size) if not font_name else ImageFont.truetype(font_name, size)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--font", default="", help="TrueType font file (default: PIL's default font).")
+    parser.add_argument("--sizes", default="10,16,24,48", help="Comma-separated font sizes.")
+    args = parser.parse_args(argv)
+    if not args.font and not SCALABLE_DEFAULT_FONT:
+        parser.error(f"PIL's default font can't be scaled with Pillow {PIL.__version__} (10.1 or later is needed); pass --font")
+
+    wrap = common.node_module("snap_text").SnapTextOverlay.wrap_text_pixel_width
+    draw = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+    failures = 0; cases = 0; legacy_seconds = 0.0; fast_seconds = 0.0
+    for size in common.parse_list(args.sizes, int):
+        # Separate font objects, so the fast path starts without the measurements the other one made
+        legacy_font = load(args.font, size); fast_font = load(args.font, size)
+        for text in CORPUS:
+            for width in WIDTHS:
+                start = time.perf_counter(); expected = legacy_wrap_text_pixel_width(draw, text, legacy_font, width)
+                middle = time.perf_counter(); actual = wrap(draw, text, fast_font, width)
+                legacy_seconds += middle - start; fast_seconds += time.perf_counter() - middle; cases += 1
+                if actual != expected:
+                    failures += 1
+                    print(f"MISMATCH size={size} width={width} text={text[:40]!r}\n  expected {expected}\n  got      {actual}")
+    print(f"{cases} cases, {failures} mismatches; original {legacy_seconds * 1000:.1f} ms, current {fast_seconds * 1000:.1f} ms")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+# File: benchmarks/common.py
+# Shared helpers for the ComfySnap benchmark and golden-output scripts
+import contextlib
+import hashlib
+import importlib.util
+import io
+import os
+import platform
+import sys
+
+import numpy as np
+import torch
+import PIL
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_NAME = "comfysnap"
+
+SHORT_TEXT = "Snap!"
+MEDIUM_TEXT = "when the group chat goes quiet right after you send the meme"
+LONG_TEXT = " ".join([MEDIUM_TEXT, "and nobody reacts for three hours, so you start wondering whether",
+                      "the wifi is down or everyone is just pretending not to have seen it"] * 3)
+TEXT_LENGTHS = {"short": SHORT_TEXT, "medium": MEDIUM_TEXT, "long": LONG_TEXT}
+
+
+def load_package():
+    """
+    Imports the repository as the package PACKAGE_NAME (the node modules use relative imports),
+    silencing the node loader's console output.
+
+    Returns:
+        module: The package; node modules are available as attributes after import.
+    """
+    if PACKAGE_NAME in sys.modules:
+        return sys.modules[PACKAGE_NAME]
+    spec = importlib.util.spec_from_file_location(PACKAGE_NAME, os.path.join(REPO_DIR, "__init__.py"),
+                                                  submodule_search_locations=[REPO_DIR])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE_NAME] = package
+    with contextlib.redirect_stdout(io.StringIO()):
+        spec.loader.exec_module(package)
+    return package
+
+
+def node_module(name):
+    """Returns one node module (e.g. "snap_filters") of the loaded package."""
+    load_package()
+    return importlib.import_module(f"{PACKAGE_NAME}.{name}")
+
+
+def synthetic_batch(batch_size, height, width, seed=0, device="cpu"):
+    """
+    A deterministic (B, H, W, 3) float image batch in 0-1: smooth color gradients, a bright
+    blob that moves from frame to frame and mild noise, so filters, JPEG and text see image-like content.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    ys = torch.linspace(0.0, 1.0, height).view(1, height, 1)
+    xs = torch.linspace(0.0, 1.0, width).view(1, 1, width)
+    phase = torch.arange(batch_size, dtype=torch.float32).view(batch_size, 1, 1) / max(1, batch_size)
+    r = 0.5 + 0.4 * torch.sin(6.0 * xs + 3.0 * phase)
+    g = 0.5 + 0.4 * torch.cos(5.0 * ys + 2.0 * phase)
+    b = (xs + ys) / 2.0 * torch.ones_like(phase)
+    blob = torch.exp(-((xs - 0.3 - 0.4 * phase) ** 2 + (ys - 0.5) ** 2) / 0.02)
+    image = torch.stack(torch.broadcast_tensors(r + blob, g + blob, b + blob), dim=-1)
+    image += 0.03 * torch.randn(image.shape, generator=generator)
+    return image.clamp_(0.0, 1.0).to(device)
+
+
+def synthetic_masks(batch_size, height, width):
+    """A (B, H, W) batch of elliptical "face" masks drifting down the frame."""
+    ys = torch.linspace(0.0, 1.0, height).view(1, height, 1)
+    xs = torch.linspace(0.0, 1.0, width).view(1, 1, width)
+    center_y = 0.3 + 0.4 * torch.arange(batch_size, dtype=torch.float32).view(batch_size, 1, 1) / max(1, batch_size)
+    return (((xs - 0.5) / 0.15) ** 2 + ((ys - center_y) / 0.2) ** 2 <= 1.0).to(torch.float32)
+
+
+def environment():
+    """Versions and settings that affect both timings and output bits."""
+    return {"python": platform.python_version(), "torch": torch.__version__, "pillow": PIL.__version__,
+            "numpy": np.__version__, "platform": platform.platform(), "torch_threads": torch.get_num_threads()}
+
+
+def image_checksum(image):
+    """SHA-256 of a 0-1 image tensor quantized to 8-bit levels (rounded), with its shape."""
+    levels = image.detach().cpu().clamp(0.0, 1.0).mul(255.0).round_().to(torch.uint8)
+    return hashlib.sha256(str(tuple(levels.shape)).encode() + levels.numpy().tobytes()).hexdigest()
+
+
+def image_thumbnail(image, size=8):
+    """Per-channel size x size average-pooled summary of a whole batch in 0-255 units, for drift reports."""
+    pooled = torch.nn.functional.adaptive_avg_pool2d(image.detach().cpu().float().mean(dim=0).permute(2, 0, 1), size)
+    return [round(v, 3) for v in pooled.mul(255.0).flatten().tolist()]
+
+
+def node_cases(font_name="arial.ttf", filter_types=None, presets=None, backends=None, text_lengths=None,
+               precisions=("float",), color_engines=("direct",), process_workers=0):
+    """
+    The node configurations the scripts exercise, each calling the node's execute() directly.
+
+    Returns:
+        list: dicts with "name" (unique label), "input" ("image" or "mask") and "run" (input tensor -> outputs tuple).
+    """
+    filters = node_module("snap_filters").SnapBasicFilters
+    effects = node_module("snap_effects").LowQualityDigitalLook
+    text = node_module("snap_text").SnapTextOverlay
+    face = node_module("face_avoid").FaceAvoidRandomY
+    cases = []
+    for filter_type in filter_types or [f for f in filters.FILTER_TYPES if f != "original"]:
+        for precision in precisions:
+            cases.append({"name": f"filters/{filter_type}/{precision}", "input": "image",
+                          "run": lambda x, f=filter_type, p=precision: filters().execute(x, f, 1.0, False, False, 0, 0.5, 1.0, p)})
+        if "lut" in color_engines:
+            cases.append({"name": f"filters/{filter_type}/lut", "input": "image",
+                          "run": lambda x, f=filter_type: filters().execute(x, f, 1.0, False, False, 0, 0.5, 1.0, color_engine="lut")})
+    for preset in presets or effects.PRESET_MODES:
+        for backend in backends or effects.JPEG_BACKENDS:
+            cases.append({"name": f"effects/{preset}/{backend}", "input": "image",
+                          "run": lambda x, p=preset, b=backend: effects().execute(x, p, 0.5, 0, b, process_workers=process_workers)})
+        if "lut" in color_engines:
+            cases.append({"name": f"effects/{preset}/simulated/lut", "input": "image",
+                          "run": lambda x, p=preset: effects().execute(x, p, 0.5, 0, "simulated", color_engine="lut")})
+    for length in text_lengths or list(TEXT_LENGTHS):
+        cases.append({"name": f"text/{length}", "input": "image",
+                      "run": lambda x, t=TEXT_LENGTHS[length]: text().execute(x, t, font_name, 0.05, 0.7, 4, "bottom", 0.0,
+                                                                            "#FFFFFF", "#000000", 0.5, process_workers=process_workers)})
+    # Varying captions take the glyph atlas with FreeType fonts and PIL's renderer with bitmap fonts. A missing font
+    # falls back to PIL's default font, which is a bitmap font without FreeType and on Pillow < 10.1.
+    for label, font in (("", font_name), ("/default_font", "missing-font.ttf")):
+        cases.append({"name": f"text/per_frame{label}", "input": "image",
+                      "run": lambda x, f=font: text().execute(x, "\n".join([SHORT_TEXT, MEDIUM_TEXT]), f, 0.05, 0.7, 4, "bottom", 0.0,
+                                                              "#FFFFFF", "#000000", 0.5, per_frame_text=True, process_workers=process_workers)})
+    cases.append({"name": "face_avoid/per_frame", "input": "mask",
+                  "run": lambda m: face().execute(m, 0.5, 0.0, 15.0, 0, True, per_frame=True)})
+    return cases
+
+
+def parse_list(value, cast=str):
+    """Splits a comma-separated command-line value."""
+    return [cast(v.strip()) for v in value.split(",") if v.strip()]
@@ -0,0 +1,81 @@
+# File: benchmarks/import_budget.py
+"""
+Measures how long importing the package takes and checks it against a budget.
+
+    python benchmarks/import_budget.py                    # median of fresh-interpreter imports vs. --budget-ms
+    python benchmarks/import_budget.py --update-manifest  # rebuild node_manifest.json after changing a node
+
+torch is imported before the timer starts, as it already is in ComfyUI, so the figure is the
+package's own cost. The check also fails when the manifest is out of date (the package then
+falls back to importing every node module) or when a node module was imported during registration.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+import common
+
+PROBE = r"""
+import importlib.util, json, os, sys, time
+{preload}
+repo = {repo!r}
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location("comfysnap", os.path.join(repo, "__init__.py"), submodule_search_locations=[repo])
+package = importlib.util.module_from_spec(spec); sys.modules["comfysnap"] = package
+spec.loader.exec_module(package)
+elapsed = time.perf_counter() - start
+loaded = sorted(name for name in sys.modules if name.startswith("comfysnap.") and name.split(".")[1] in package.NODE_FILES)
+print(json.dumps({{"seconds": elapsed, "nodes": len(package.NODE_CLASS_MAPPINGS), "loaded_modules": loaded}}))
+"""
+
+
+def measure(preload, eager=False):
+    """Imports the package in a fresh interpreter and returns the probe's JSON report."""
+    env = dict(os.environ); env.pop("COMFYSNAP_PREWARM", None)
+    if eager: env["COMFYSNAP_EAGER"] = "1"
+    else: env.pop("COMFYSNAP_EAGER", None)
+    code = PROBE.format(preload="import torch" if preload else "", repo=common.REPO_DIR)
+    output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def update_manifest():
+    package = common.load_package()
+    lazy_nodes = common.node_module("lazy_nodes")
+    manifest = lazy_nodes.build_manifest(common.PACKAGE_NAME, package.NODE_FILES)
+    with open(lazy_nodes.MANIFEST_PATH, "w") as handle:
+        json.dump(manifest, handle, indent=1); handle.write("\n")
+    print(f"Wrote {len(manifest['nodes'])} nodes to {lazy_nodes.MANIFEST_PATH}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=10.0, help="Maximum median import time of the package.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--no-preload", action="store_true", help="Don't import torch before timing.")
+    parser.add_argument("--update-manifest", action="store_true", help="Rebuild node_manifest.json and exit.")
+    args = parser.parse_args(argv)
+    if args.update_manifest:
+        update_manifest(); return 0
+
+    preload = not args.no_preload
+    lazy = [measure(preload) for _ in range(args.runs)]
+    eager = [measure(preload, eager=True) for _ in range(args.runs)]
+    lazy_ms = statistics.median(r["seconds"] for r in lazy) * 1000.0
+    eager_ms = statistics.median(r["seconds"] for r in eager) * 1000.0
+    print(f"lazy import:  {lazy_ms:7.2f} ms ({lazy[0]['nodes']} nodes, modules loaded: {lazy[0]['loaded_modules'] or 'none'})")
+    print(f"eager import: {eager_ms:7.2f} ms ({eager[0]['nodes']} nodes)")
+
+    failures = []
+    if lazy[0]["loaded_modules"]: failures.append("node modules were imported at registration; is node_manifest.json out of date?")
+    if lazy[0]["nodes"] != eager[0]["nodes"]: failures.append("the manifest registers a different set of nodes than the modules")
+    if lazy_ms > args.budget_ms: failures.append(f"import took {lazy_ms:.2f} ms, over the {args.budget_ms:.2f} ms budget")
+    for failure in failures: print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
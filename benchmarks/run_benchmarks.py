@@ -0,0 +1,139 @@
+# File: benchmarks/run_benchmarks.py
+"""
+Times every ComfySnap node on synthetic batches and saves the results as JSON.
+
+    python benchmarks/run_benchmarks.py                                # quick sweep
+    python benchmarks/run_benchmarks.py --suite full --output base.json
+    python benchmarks/run_benchmarks.py --compare base.json            # flags regressions against a saved run
+
+Each case calls the node's execute() directly: one warm-up call, then --repeats timed calls.
+Reported per case: frames/sec, per-frame latency percentiles (call time / batch size over the
+repeats) and the peak resident memory seen while the case ran.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+import common
+
+SUITES = {
+    "quick": {"batch_sizes": [1, 16], "resolutions": [(512, 512), (1024, 1024)]},
+    "full": {"batch_sizes": [1, 16, 64, 256], "resolutions": [(512, 512), (1024, 1024), (2048, 2048), (2160, 3840)]},
+}
+
+
+def current_rss():
+    """Resident set size of this process in bytes (Linux /proc; ru_maxrss elsewhere, which never decreases)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RssSampler:
+    """Polls the RSS on a background thread and keeps the peak, since the OS only reports a lifetime maximum."""
+    def __init__(self, interval=0.005):
+        self.interval = interval; self.peak = 0
+        self._stop = threading.Event(); self._thread = None
+
+    def __enter__(self):
+        self.peak = current_rss(); self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True); self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval): self.peak = max(self.peak, current_rss())
+
+    def __exit__(self, *exc):
+        self._stop.set(); self._thread.join(); self.peak = max(self.peak, current_rss())
+
+
+def run_case(case, batch_size, height, width, repeats):
+    """Times one node configuration on one input size."""
+    gc.collect()
+    baseline_rss = current_rss()
+    data = common.synthetic_masks(batch_size, height, width) if case["input"] == "mask" else common.synthetic_batch(batch_size, height, width)
+    with RssSampler() as rss:
+        case["run"](data)  # warm-up: fills font/sprite caches and the JPEG thread pool
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter(); outputs = case["run"](data); timings.append(time.perf_counter() - start)
+            del outputs
+    del data
+    per_frame_ms = np.array(timings) * 1000.0 / batch_size
+    return {"case": case["name"], "batch_size": batch_size, "height": height, "width": width, "repeats": repeats,
+            "fps": batch_size / float(np.median(timings)),
+            "latency_ms": {f"p{q}": float(np.percentile(per_frame_ms, q)) for q in (50, 90, 99)},
+            "peak_rss_mb": rss.peak / 2**20, "rss_delta_mb": (rss.peak - baseline_rss) / 2**20}
+
+
+def compare(results, baseline_path, tolerance):
+    """Prints the fps ratio of every case also present in a saved run; returns the number of regressions."""
+    with open(baseline_path) as handle: baseline = json.load(handle)
+    key = lambda r: (r["case"], r["batch_size"], r["height"], r["width"])
+    previous = {key(r): r for r in baseline["results"]}
+    regressions = 0
+    for result in results:
+        old = previous.get(key(result))
+        if old is None: continue
+        ratio = result["fps"] / old["fps"] if old["fps"] else float("inf")
+        flag = ""
+        if ratio < 1.0 - tolerance: flag = "  REGRESSION"; regressions += 1
+        print(f"{result['case']:<48} {result['batch_size']:>4}x{result['height']}x{result['width']:<5} {ratio:6.2f}x{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suite", choices=sorted(SUITES), default="quick", help="Preset sweep of batch sizes and resolutions.")
+    parser.add_argument("--batch-sizes", help="Comma-separated batch sizes, overriding the suite.")
+    parser.add_argument("--resolutions", help="Comma-separated HxW sizes (e.g. 512x512,2160x3840), overriding the suite.")
+    parser.add_argument("--cases", default="", help="Only run cases whose name contains one of these comma-separated strings.")
+    parser.add_argument("--font", default="arial.ttf", help="Font for the text cases.")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--process-workers", type=int, default=0, help="process_workers of the effects and text cases (0 = in-process).")
+    parser.add_argument("--max-input-mb", type=float, default=4096.0, help="Skip sizes whose input batch exceeds this.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--compare", help="A previous --output file to compare frames/sec against.")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Fractional fps drop reported as a regression.")
+    args = parser.parse_args(argv)
+
+    suite = SUITES[args.suite]
+    batch_sizes = common.parse_list(args.batch_sizes, int) if args.batch_sizes else suite["batch_sizes"]
+    resolutions = [tuple(int(v) for v in r.split("x")) for r in common.parse_list(args.resolutions)] if args.resolutions else suite["resolutions"]
+    filters = common.parse_list(args.cases)
+    cases = [c for c in common.node_cases(args.font, color_engines=("direct", "lut"), process_workers=args.process_workers) if not filters or any(f in c["name"] for f in filters)]
+
+    results = []
+    for height, width in resolutions:
+        for batch_size in batch_sizes:
+            input_mb = batch_size * height * width * 3 * 4 / 2**20
+            if input_mb > args.max_input_mb:
+                print(f"skip {batch_size}x{height}x{width}: input is {input_mb:.0f} MB (--max-input-mb {args.max_input_mb:.0f})")
+                continue
+            for case in cases:
+                result = run_case(case, batch_size, height, width, args.repeats); results.append(result)
+                latency = result["latency_ms"]
+                print(f"{result['case']:<48} {batch_size:>4}x{height}x{width:<5} {result['fps']:9.1f} fps  "
+                      f"p50 {latency['p50']:8.2f} ms  p90 {latency['p90']:8.2f} ms  p99 {latency['p99']:8.2f} ms  "
+                      f"peak {result['peak_rss_mb']:8.0f} MB", flush=True)
+
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump({"environment": common.environment(), "suite": args.suite, "results": results}, handle, indent=1)
+    if args.compare:
+        return 1 if compare(results, args.compare, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+# File: color_lut.py
+# Compiles pointwise color transforms into lookup tables that cost one gather per pixel
+import torch
+import torch.nn.functional as F
+from .utils import LRUCache
+
+LUT_SIZE = 33  # lattice points per axis of a 3D LUT
+CURVE_SIZE = 1024  # entries of each per-channel 1D LUT
+# Compiled LUTs keyed by what produced them (filter, strength, preset parameters, mean level) and the device
+LUT_CACHE = LRUCache(max_entries=128)
+
+
+class ColorLUT:
+    """
+    A color transform of 0-1 RGB values compiled into a table.
+
+    Separable transforms (each output channel depends only on the same input channel) become three
+    CURVE_SIZE-entry curves; anything else becomes a LUT_SIZE^3 lattice sampled with trilinear
+    interpolation. Either way a whole batch goes through apply() in a single lookup pass, however
+    many operations were chained into the transform.
+    """
+    def __init__(self, table, separable):
+        self.table = table
+        self.separable = separable
+
+    @classmethod
+    def compile(cls, transform, separable, device="cpu", size=None):
+        """
+        Evaluates transform (a function of a (..., 3) 0-1 tensor) on a grid and keeps the results.
+
+        Args:
+            transform (callable): The color transform; must be pointwise.
+            separable (bool): Build per-channel curves instead of a 3D lattice.
+            device: Device the table lives on (and the batches it is applied to).
+            size (int, optional): Curve length or lattice points per axis.
+        """
+        if separable:
+            n = size or CURVE_SIZE
+            samples = torch.linspace(0.0, 1.0, n, device=device).view(n, 1).expand(n, 3).contiguous()
+            return cls(transform(samples).t().contiguous(), True)  # (3, n)
+        n = size or LUT_SIZE
+        axis = torch.linspace(0.0, 1.0, n, device=device)
+        b, g, r = torch.meshgrid(axis, axis, axis, indexing="ij")
+        lattice = transform(torch.stack((r, g, b), dim=-1))  # (n_b, n_g, n_r, 3)
+        return cls(lattice.permute(3, 0, 1, 2).unsqueeze(0).contiguous(), False)  # (1, 3, D=b, H=g, W=r)
+
+    def apply(self, x):
+        """Maps a (..., 3) 0-1 tensor through the table; returns a new float32 tensor of the same shape."""
+        shape = x.shape; points = x.reshape(-1, 3).to(torch.float32).clamp(0.0, 1.0)
+        if self.separable:
+            n = self.table.shape[1]
+            position = points * (n - 1); index = position.floor().clamp_(max=n - 2); fraction = position - index
+            index = index.long() + torch.arange(3, device=x.device) * n  # offsets into the flattened (3, n) table
+            flat = self.table.view(-1)
+            low = flat[index]; high = flat[index + 1]
+            return low.add_(fraction.mul_(high - low)).view(shape)
+        # grid_sample reads the last grid coordinate as depth: (r, g, b) addresses (W, H, D) of the lattice
+        grid = points.mul(2.0).sub_(1.0).view(1, -1, 1, 1, 3)
+        sampled = F.grid_sample(self.table, grid, mode="bilinear", padding_mode="border", align_corners=True)
+        return sampled.view(3, -1).t().reshape(shape)
+
+
+def cached_lut(key, transform, separable, device):
+    """Returns the ColorLUT memoized under key on device, compiling transform on a miss."""
+    return LUT_CACHE.get_or_create((key, separable, str(device)), lambda: ColorLUT.compile(transform, separable, device))
+
+
+def frame_mean_levels(x, weights):
+    """Mean luma of every frame of a (B, H, W, 3) 0-1 batch, rounded to 8-bit levels (the bucket mean-dependent LUTs are keyed by)."""
+    luma = (x[..., 0] * weights[0] + x[..., 1] * weights[1] + x[..., 2] * weights[2]) / 65536.0
+    return torch.round(luma.double().mean(dim=(1, 2)) * 255.0).long().tolist()
+
+
+def apply_grouped(x, frame_keys, build):
+    """
+    Applies a per-frame LUT to a (B, H, W, 3) batch. Frames with equal keys share one LUT from
+    build(key) and one lookup pass.
+    """
+    if len(set(frame_keys)) == 1: return build(frame_keys[0]).apply(x[..., :3])
+    out = torch.empty(x.shape[:-1] + (3,), dtype=torch.float32, device=x.device)
+    for key in dict.fromkeys(frame_keys):
+        index = torch.tensor([i for i, k in enumerate(frame_keys) if k == key], dtype=torch.long, device=x.device)
+        out[index] = build(key).apply(x[index][..., :3])
+    return out
@@ -1,83 +1,137 @@
-# File: face_avoid.py
-import torch
-import numpy as np
-import random
-
-class FaceAvoidRandomY:
-    """
-    Calculates the vertical centroid of a face mask, adjusts it,
-    and optionally generates a random vertical position (0-100 scale, 100=Top)
-    that avoids a zone around the adjusted centroid.
-    Y Scale: 100=Top, 0=Bottom
-    """
-    @classmethod
-    def INPUT_TYPES(s):
-        return {
-            "required": {
-                "mask": ("MASK",),
-                "centroid_threshold": ("FLOAT", {"default": 0.5, "min": 0.01, "max": 1.0, "step": 0.01}),
-                "vertical_adjustment": ("FLOAT", {"default": 0.0, "min": -100.0, "max": 100.0, "step": 1.0, "round": 0.1}),
-                "avoid_threshold": ("FLOAT", {"default": 15.0, "min": 0.0, "max": 50.0, "step": 0.1}),
-                "seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}),
-                "generate_random": ("BOOLEAN", {"default": True}),
-            },
-        }
-
-    RETURN_TYPES = ("FLOAT",)
-    RETURN_NAMES = ("vertical_pos_100_top",)
-    FUNCTION = "execute"
-    CATEGORY = "ComfySnap"
-
-    def execute(self, mask: torch.Tensor, centroid_threshold: float,
-                vertical_adjustment: float,
-                avoid_threshold: float, seed: int, generate_random: bool):
-
-        # Add validation for mask dimensions
-        if mask.dim() != 3:
-            raise ValueError("Input mask must be a 3D tensor with shape (batch_size, height, width).")
-
-        if mask.dim() != 3: raise ValueError("FaceAvoidRandomY: Input mask must be (batch, height, width).")
-        batch_size, height, width = mask.shape; scaled_center_y = 50.0
-
-        if height <= 1: pass
-        else:
-            single_mask = mask[0]; binary_mask = (single_mask > centroid_threshold).float(); mask_sum = torch.sum(binary_mask)
-            if mask_sum > 0:
-                yy = torch.arange(height, device=mask.device, dtype=mask.dtype).unsqueeze(1).repeat(1, width)
-                sum_y_weighted = torch.sum(yy * binary_mask); centroid_y_pixels = sum_y_weighted / mask_sum
-                normalized_y = torch.clamp(centroid_y_pixels / (height - 1), 0.0, 1.0); scaled_center_y = (100.0 * (1.0 - normalized_y)).item()
-
-        adjusted_center_y = max(0.0, min(100.0, scaled_center_y + vertical_adjustment))
-
-        if not generate_random: return (adjusted_center_y,)
-
-        random.seed(seed); min_overall = 0.0; max_overall = 100.0
-
-        exclude_bottom = max(min_overall, adjusted_center_y - avoid_threshold)
-        exclude_top = min(max_overall, adjusted_center_y + avoid_threshold)
-
-        size1 = max(0.0, exclude_bottom - min_overall)
-        size2 = max(0.0, max_overall - exclude_top)
-        total_allowed_size = size1 + size2
-
-        random_y_pos = adjusted_center_y
-
-        if total_allowed_size > 0:
-            yr = random.uniform(0, total_allowed_size)
-            if yr < size1:
-                random_y_pos = min_overall + yr
-            else:
-                range2_min = exclude_top
-                random_y_pos = range2_min + (yr - size1)
-        else: print("Warning: Face avoidance zone covers entire range. Returning adjusted center.")
-
-        random_y_pos = max(min_overall, min(max_overall, random_y_pos))
-
-        return (random_y_pos,)
-
-NODE_CLASS_MAPPINGS = {
-    "FaceAvoidRandomY": FaceAvoidRandomY
-}
-NODE_DISPLAY_NAME_MAPPINGS = {
-    "FaceAvoidRandomY": "Face Avoid"
+# File: face_avoid.py
+import torch
+import random
+from .base_node import BaseNode
+from .utils import derive_frame_seed, resolve_chunk_size, CHUNK_INPUTS, result_cached
+from .snap_stream import STREAM_INPUTS, STREAM_HIDDEN_INPUTS, stream_session, stream_consumer
+
+class FaceAvoidRandomY(BaseNode):
+    """
+    Calculates the vertical centroid of a face mask, adjusts it,
+    and optionally generates a random vertical position (0-100 scale, 100=Top)
+    that avoids a zone around the adjusted centroid.
+    Y Scale: 100=Top, 0=Bottom
+    """
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "mask": ("MASK",),
+                "centroid_threshold": ("FLOAT", {"default": 0.5, "min": 0.01, "max": 1.0, "step": 0.01}),
+                "vertical_adjustment": ("FLOAT", {"default": 0.0, "min": -100.0, "max": 100.0, "step": 1.0, "round": 0.1}),
+                "avoid_threshold": ("FLOAT", {"default": 15.0, "min": 0.0, "max": 50.0, "step": 0.1}),
+                "seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}),
+                "generate_random": ("BOOLEAN", {"default": True}),
+            },
+            "optional": {
+                "per_frame": ("BOOLEAN", {"default": False}),
+                "temporal_smoothing": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 0.99, "step": 0.01}),
+                **STREAM_INPUTS,
+                **CHUNK_INPUTS,
+                "use_result_cache": ("BOOLEAN", {"default": False}),
+            },
+            "hidden": {**STREAM_HIDDEN_INPUTS},
+        }
+
+    RETURN_TYPES = ("FLOAT", "FLOAT")
+    RETURN_NAMES = ("vertical_pos_100_top", "vertical_pos_per_frame")
+    FUNCTION = "execute"
+    CATEGORY = "ComfySnap"
+
+    @staticmethod
+    def mask_centroids(mask: torch.Tensor, centroid_threshold: float):
+        """
+        Vertical centroids of every mask in a (B, H, W) batch on the 0-100 scale (100=Top), 50.0 for empty masks.
+        Uses one reduction over the row axis (row pixel counts weighted by row index) instead of an H x W index grid.
+        """
+        batch_size, height, width = mask.shape
+        if height <= 1: return torch.full((batch_size,), 50.0, dtype=torch.float64, device=mask.device)
+        row_counts = (mask > centroid_threshold).sum(dim=2).to(torch.float64)
+        counts = row_counts.sum(dim=1)
+        centroid_y_pixels = (row_counts @ torch.arange(height, dtype=torch.float64, device=mask.device)) / counts.clamp(min=1.0)
+        normalized_y = torch.clamp(centroid_y_pixels / (height - 1), 0.0, 1.0)
+        return torch.where(counts > 0, 100.0 * (1.0 - normalized_y), torch.full_like(counts, 50.0))
+
+    @classmethod
+    def chunked_centroids(cls, mask: torch.Tensor, centroid_threshold: float, chunk_size: int = 0, max_memory_mb: int = 0):
+        """mask_centroids() over bounded slices of the batch, so the thresholded mask never exists for all frames at once."""
+        batch_size, height, width = mask.shape
+        chunk = resolve_chunk_size(batch_size, 4 * height * width, chunk_size, max_memory_mb, work_factor=2)
+        if chunk >= batch_size: return cls.mask_centroids(mask, centroid_threshold)
+        return torch.cat([cls.mask_centroids(mask[start:start + chunk], centroid_threshold) for start in range(0, batch_size, chunk)])
+
+    @staticmethod
+    def avoid_positions(adjusted_center_y: torch.Tensor, avoid_threshold: float, u: torch.Tensor):
+        """Maps uniform draws u in [0, 1) onto the 0-100 range minus the zone of +/- avoid_threshold around each center."""
+        min_overall = 0.0; max_overall = 100.0
+        exclude_bottom = torch.clamp(adjusted_center_y - avoid_threshold, min=min_overall)
+        exclude_top = torch.clamp(adjusted_center_y + avoid_threshold, max=max_overall)
+        size1 = torch.clamp(exclude_bottom - min_overall, min=0.0); size2 = torch.clamp(max_overall - exclude_top, min=0.0)
+        total_allowed_size = size1 + size2; yr = u * total_allowed_size
+        random_y_pos = torch.where(yr < size1, min_overall + yr, exclude_top + (yr - size1))
+        random_y_pos = torch.where(total_allowed_size > 0, random_y_pos, adjusted_center_y)
+        return torch.clamp(random_y_pos, min_overall, max_overall)
+
+    @staticmethod
+    def smooth(values: torch.Tensor, temporal_smoothing: float, previous: float = None):
+        """
+        Exponential moving average along the frame axis; 0 leaves values unchanged.
+        previous is the smoothed value of the frame before the first one (from the last batch of a stream).
+        """
+        if temporal_smoothing <= 0.0 or values.numel() == 0 or (values.numel() < 2 and previous is None): return values
+        smoothed = values.tolist()
+        if previous is not None: smoothed[0] = temporal_smoothing * previous + (1.0 - temporal_smoothing) * smoothed[0]
+        for i in range(1, len(smoothed)): smoothed[i] = temporal_smoothing * smoothed[i - 1] + (1.0 - temporal_smoothing) * smoothed[i]
+        return torch.tensor(smoothed, dtype=values.dtype, device=values.device)
+
+    @result_cached
+    def execute(self, mask: torch.Tensor, centroid_threshold: float,
+                vertical_adjustment: float,
+                avoid_threshold: float, seed: int, generate_random: bool,
+                per_frame: bool = False, temporal_smoothing: float = 0.0,
+                chunk_size: int = 0, max_memory_mb: int = 0, stream_id: str = "", stream_reset: bool = False, unique_id: str = None):
+
+        # Add validation for mask dimensions
+        if mask.dim() != 3:
+            raise ValueError("Input mask must be a 3D tensor with shape (batch_size, height, width).")
+        batch_size = mask.shape[0]
+        session = stream_session(stream_id, stream_reset)
+        first_frame = session.claim(stream_consumer(self, unique_id), batch_size) if session is not None else 0
+
+        if per_frame and batch_size > 0:
+            # Every frame gets its own centroid and draw; smoothing keeps consecutive positions from jittering.
+            # In a stream, draws are seeded per absolute frame and the smoothing continues from the last batch.
+            state = session.state(stream_consumer(self, unique_id)) if session is not None else {}
+            with self.stage("centroid"): centers = self.chunked_centroids(mask, centroid_threshold, chunk_size, max_memory_mb).cpu()
+            centers = self.smooth(centers, temporal_smoothing, state.get("center"))
+            adjusted_center_y = torch.clamp(centers + vertical_adjustment, 0.0, 100.0)
+            positions = adjusted_center_y
+            if generate_random:
+                u = torch.tensor([random.Random(derive_frame_seed(seed, first_frame + i)).random() for i in range(batch_size)], dtype=torch.float64)
+                u = self.smooth(u, temporal_smoothing, state.get("u"))
+                positions = self.avoid_positions(adjusted_center_y, avoid_threshold, u)
+                state["u"] = u[-1].item()
+            state["center"] = centers[-1].item()
+            positions = positions.tolist()
+            return (positions[0], positions)
+
+        with self.stage("centroid"): scaled_center_y = self.mask_centroids(mask[:1], centroid_threshold).item() if batch_size > 0 else 50.0
+        adjusted_center_y = max(0.0, min(100.0, scaled_center_y + vertical_adjustment))
+
+        if not generate_random: return (adjusted_center_y, [adjusted_center_y] * batch_size)
+
+        # A local generator draws the same value random.seed(seed); random.uniform(...) used to, without reseeding the global RNG
+        u = torch.tensor([random.Random(seed).random()], dtype=torch.float64)
+        random_y_pos = self.avoid_positions(torch.tensor([adjusted_center_y], dtype=torch.float64), avoid_threshold, u).item()
+        if adjusted_center_y - avoid_threshold <= 0.0 and adjusted_center_y + avoid_threshold >= 100.0:
+            self.log_warning("Face avoidance zone covers entire range. Returning adjusted center.", event="zone_covers_range",
+                             center=adjusted_center_y, avoid_threshold=avoid_threshold)
+
+        return (random_y_pos, [random_y_pos] * batch_size)
+
+NODE_CLASS_MAPPINGS = {
+    "FaceAvoidRandomY": FaceAvoidRandomY
+}
+NODE_DISPLAY_NAME_MAPPINGS = {
+    "FaceAvoidRandomY": "Face Avoid"
 }
\ No newline at end of file
@@ -0,0 +1,128 @@
+# File: lazy_nodes.py
+# Registers the nodes from a static manifest so importing the package doesn't import the node modules
+import copy
+import hashlib
+import importlib
+import json
+import os
+import threading
+
+MANIFEST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "node_manifest.json")
+# Class attributes ComfyUI reads before a node runs; INPUT_TYPES is stored separately
+CLASS_ATTRIBUTES = ["RETURN_TYPES", "RETURN_NAMES", "FUNCTION", "CATEGORY", "OUTPUT_NODE",
+                    "INPUT_IS_LIST", "OUTPUT_IS_LIST", "DESCRIPTION"]
+# Modules whose contents end up in the manifest besides the node modules themselves (shared input specs)
+SHARED_MODULES = ["utils", "base_node", "snap_workers", "snap_stream"]
+
+
+def source_digest(module_names):
+    """
+    Hash of the node sources the manifest was built from (line endings normalized), so a
+    manifest that no longer matches the code on disk is detected and ignored.
+    """
+    digest = hashlib.sha1()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(set(module_names) | set(SHARED_MODULES)):
+        path = os.path.join(here, f"{name}.py")
+        if not os.path.exists(path): continue
+        with open(path, "rb") as handle: digest.update(name.encode() + b"\0" + handle.read().replace(b"\r\n", b"\n"))
+    return digest.hexdigest()
+
+
+def build_manifest(package, module_names):
+    """Imports the node modules and describes every node class they register, for writing to MANIFEST_PATH."""
+    nodes = {}
+    for module_name in module_names:
+        module = importlib.import_module(f".{module_name}", package=package)
+        names = getattr(module, "NODE_DISPLAY_NAME_MAPPINGS", {})
+        for node_name, node_class in getattr(module, "NODE_CLASS_MAPPINGS", {}).items():
+            entry = {"module": module_name, "class": node_class.__name__, "display_name": names.get(node_name, node_name),
+                     "INPUT_TYPES": node_class.INPUT_TYPES()}
+            for attribute in CLASS_ATTRIBUTES:
+                if hasattr(node_class, attribute): entry[attribute] = getattr(node_class, attribute)
+            nodes[node_name] = entry
+    # Round-trip through JSON so the in-memory result equals what a reader of the file sees
+    return json.loads(json.dumps({"source_digest": source_digest(module_names), "nodes": nodes}))
+
+
+def read_manifest(module_names):
+    """Returns the manifest's nodes, or None when the file is missing, unreadable or stale."""
+    try:
+        with open(MANIFEST_PATH) as handle: manifest = json.load(handle)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("source_digest") != source_digest(module_names): return None
+    return manifest.get("nodes")
+
+
+def _as_spec(value):
+    # JSON has no tuples; ComfyUI input specs and RETURN_TYPES are tuples
+    return tuple(value) if isinstance(value, list) else value
+
+
+def _restore_input_types(input_types):
+    return {section: {name: _as_spec(spec) for name, spec in inputs.items()} for section, inputs in input_types.items()}
+
+
+def load_node_class(package, module_name, class_name):
+    """Imports a node module (Python's import lock makes this safe alongside prewarm()) and returns the real node class."""
+    return getattr(importlib.import_module(f".{module_name}", package=package), class_name)
+
+
+def make_proxy(package, node_name, entry):
+    """
+    A stand-in node class carrying the manifest's INPUT_TYPES and class attributes. The real module
+    is imported when the node first runs; the proxy instance then forwards everything to a real instance.
+    """
+    input_types = _restore_input_types(entry["INPUT_TYPES"])
+    function = entry.get("FUNCTION", "execute")
+
+    def INPUT_TYPES(cls):
+        return copy.deepcopy(input_types)
+
+    def __init__(self):
+        self.__dict__["_node"] = None
+
+    def _resolve(self):
+        node = self.__dict__["_node"]
+        if node is None:
+            node = self.__dict__["_node"] = load_node_class(package, entry["module"], entry["class"])()
+        return node
+
+    def __getattr__(self, attribute):
+        if attribute.startswith("__"): raise AttributeError(attribute)
+        return getattr(self._resolve(), attribute)
+
+    def run(self, *args, **kwargs):
+        return getattr(self._resolve(), function)(*args, **kwargs)
+
+    attributes = {"INPUT_TYPES": classmethod(INPUT_TYPES), "__init__": __init__, "_resolve": _resolve,
+                  "__getattr__": __getattr__, function: run, "__doc__": f"Lazily loaded {entry['class']} ({entry['module']}.py)."}
+    for attribute in CLASS_ATTRIBUTES:
+        if attribute in entry: attributes[attribute] = _as_spec(entry[attribute])
+    return type(entry["class"], (), attributes)
+
+
+def lazy_mappings(package, module_names):
+    """
+    NODE_CLASS_MAPPINGS and NODE_DISPLAY_NAME_MAPPINGS made of proxies, or None when there is no
+    usable manifest (the caller then imports the modules eagerly).
+    """
+    nodes = read_manifest(module_names)
+    if nodes is None: return None
+    classes = {}; names = {}
+    for node_name, entry in nodes.items():
+        if entry["module"] not in module_names: continue
+        classes[node_name] = make_proxy(package, node_name, entry); names[node_name] = entry["display_name"]
+    return classes, names
+
+
+def prewarm(package, module_names):
+    """Imports every node module on a daemon thread, so the first execution doesn't pay for it."""
+    def run():
+        for module_name in module_names:
+            try: importlib.import_module(f".{module_name}", package=package)
+            except Exception: pass  # the node's first execute() raises the import error where it can be seen
+    thread = threading.Thread(target=run, name="comfysnap-prewarm", daemon=True)
+    thread.start()
+    return thread
@@ -1,92 +1,303 @@
-# File: snap_effects.py
-import torch
-import numpy as np
-from PIL import Image, ImageEnhance
-import io
-import random
-
-class LowQualityDigitalLook:
-    """
-    Applies simulated low-quality digital camera/Snap effects.
-    Uses an effect_level slider (0=off, 0.5=preset default, 1=max effect).
-    Includes Gaussian noise and JPEG compression.
-    """
-    PRESET_MODES = ["Standard Snap Low Light", "Early 2000s Digital"]
-
-    @classmethod
-    def INPUT_TYPES(s):
-        return {
-            "required": {
-                "image": ("IMAGE",),
-                "preset": (s.PRESET_MODES, {"default": "Standard Snap Low Light"}),
-                "effect_level": ("FLOAT", {"default": 0.5, "min": 0.0, "max": 1.0, "step": 0.01}),
-                "seed": ("INT", { "default": 0, "min": 0, "max": 4294967295 }),
-            }
-        }
-
-    RETURN_TYPES = ("IMAGE",)
-    FUNCTION = "execute"
-    CATEGORY = "ComfySnap"
-
-    def execute(self, image: torch.Tensor, preset: str, effect_level: float = 0.5, seed: int = 0):
-        effect_level = max(0.0, min(1.0, effect_level))
-        if effect_level <= 0.001: return (image,)
-        seed = max(0, min(4294967295, seed)); np.random.seed(seed)
-        batch_size, img_height, img_width, channels = image.shape; output_images = []
-
-        if preset == "Standard Snap Low Light": base_jpeg_quality = 70; base_noise_std_dev = 8.0; base_saturation = 0.9; base_brightness = 0.95; jpeg_subsampling = 0 # Default (often 4:4:4 or 4:2:2)
-        elif preset == "Early 2000s Digital": base_jpeg_quality = 50; base_noise_std_dev = 15.0; base_saturation = 0.8; base_brightness = 1.0; jpeg_subsampling = 2 # Use 4:2:0 for more color artifacts
-        else: base_jpeg_quality = 75; base_noise_std_dev = 5.0; base_saturation = 1.0; base_brightness = 1.0; jpeg_subsampling = 0
-
-        no_effect_jpeg_q = 95; no_effect_noise = 0.0; no_effect_saturation = 1.0; no_effect_brightness = 1.0
-        max_effect_jpeg_q = 15; max_effect_noise = base_noise_std_dev * 2.5
-        max_effect_saturation = 1.0 + (base_saturation - 1.0) * 1.5; max_effect_brightness = 1.0 + (base_brightness - 1.0) * 1.5
-
-        def interpolate(level, val0, val05, val1):
-            if level <= 0.5: factor = level / 0.5; return val0 + factor * (val05 - val0)
-            else: factor = (level - 0.5) / 0.5; return val05 + factor * (val1 - val05)
-
-        actual_jpeg_quality = interpolate(effect_level, no_effect_jpeg_q, base_jpeg_quality, max_effect_jpeg_q)
-        actual_noise_std_dev = interpolate(effect_level, no_effect_noise, base_noise_std_dev, max_effect_noise)
-        actual_saturation = interpolate(effect_level, no_effect_saturation, base_saturation, max_effect_saturation)
-        actual_brightness = interpolate(effect_level, no_effect_brightness, base_brightness, max_effect_brightness)
-
-        actual_jpeg_quality = int(max(1, min(100, actual_jpeg_quality)))
-        actual_noise_std_dev = max(0.0, actual_noise_std_dev)
-        actual_saturation = max(0.01, actual_saturation); actual_brightness = max(0.01, actual_brightness)
-
-        for i in range(batch_size):
-            img_pil_rgb = Image.fromarray((image[i].cpu().numpy() * 255).astype(np.uint8)).convert('RGB')
-            processed_pil = img_pil_rgb
-
-            # Apply Color/Brightness First
-            if abs(actual_saturation - 1.0) > 0.01: enhancer = ImageEnhance.Color(processed_pil); processed_pil = enhancer.enhance(actual_saturation)
-            if abs(actual_brightness - 1.0) > 0.01: enhancer = ImageEnhance.Brightness(processed_pil); processed_pil = enhancer.enhance(actual_brightness)
-
-            # Apply Digital Noise (Applied BEFORE JPEG now)
-            if actual_noise_std_dev > 0.01:
-                try:
-                    img_np = np.array(processed_pil).astype(np.float32) / 255.0
-                    noise = np.random.normal(loc=0.0, scale=actual_noise_std_dev / 255.0, size=img_np.shape).astype(np.float32)
-                    noisy_img_np = np.clip(img_np + noise, 0.0, 1.0)
-                    processed_pil = Image.fromarray((noisy_img_np * 255).astype(np.uint8)) # Noisy image before JPEG
-                except Exception as e: print(f"Warning: Failed to add noise: {e}")
-
-            # Apply JPEG Compression Artifacts (Applied AFTER noise now)
-            if actual_jpeg_quality < 98:
-                 try:
-                      buffer = io.BytesIO()
-                      # Add subsampling parameter
-                      processed_pil.save(buffer, format="JPEG", quality=actual_jpeg_quality, subsampling=jpeg_subsampling)
-                      buffer.seek(0); processed_pil = Image.open(buffer).convert('RGB')
-                 except Exception as e: print(f"Warning: JPEG compression step failed: {e}")
-
-
-            final_pil = processed_pil
-            output_img_np = np.array(final_pil).astype(np.float32) / 255.0
-            output_images.append(torch.from_numpy(output_img_np))
-        output_tensor = torch.stack(output_images)
-        return (output_tensor,)
-
-NODE_CLASS_MAPPINGS = { "LowQualityDigitalLook": LowQualityDigitalLook }
+# File: snap_effects.py
+import torch
+import numpy as np
+from PIL import Image
+import torch.nn.functional as F
+import io
+import os
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .snap_filters import LUMA_WEIGHTS
+from .base_node import BaseNode, get_logger
+from .utils import derive_frame_seed, quantize_batch, pil_view, upload_batch, process_in_chunks, CHUNK_IMAGE_INPUTS, result_cached
+from .color_lut import cached_lut
+from .snap_workers import WORKER_INPUTS, run_sharded, shard_bounds
+from .snap_stream import STREAM_INPUTS, STREAM_HIDDEN_INPUTS, stream_session, stream_consumer
+
+# Annex K base quantization tables from the JPEG standard (luminance, chrominance)
+JPEG_LUMA_TABLE = [
+    16, 11, 10, 16, 24, 40, 51, 61,      12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56,      14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77,    24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101,  72, 92, 95, 98, 112, 100, 103, 99,
+]
+JPEG_CHROMA_TABLE = [
+    17, 18, 24, 47, 99, 99, 99, 99,  18, 21, 26, 66, 99, 99, 99, 99,
+    24, 26, 56, 99, 99, 99, 99, 99,  47, 66, 99, 99, 99, 99, 99, 99,
+] + [99] * 32
+# Chroma downsampling factors (vertical, horizontal) for Pillow's subsampling values 0=4:4:4, 1=4:2:2, 2=4:2:0
+JPEG_CHROMA_FACTORS = {0: (1, 1), 1: (1, 2), 2: (2, 2)}
+
+def _quality_scaled_table(table, quality, device):
+    """Scales a base quantization table for a 1-100 quality the way libjpeg's jpeg_set_quality does."""
+    quality = max(1, min(100, int(quality)))
+    scale = 5000 // quality if quality < 50 else 200 - quality * 2
+    scaled = [min(255, max(1, (q * scale + 50) // 100)) for q in table]
+    return torch.tensor(scaled, dtype=torch.float32, device=device).view(8, 8)
+
+def _dct_matrix(device):
+    n = torch.arange(8, dtype=torch.float32, device=device)
+    matrix = torch.cos((2.0 * n.view(1, 8) + 1.0) * n.view(8, 1) * math.pi / 16.0) * math.sqrt(2.0 / 8.0)
+    matrix[0] /= math.sqrt(2.0)
+    return matrix
+
+def _quantize_blocks(plane, table, dct):
+    """Round-trips an (N, H, W) level-shifted plane through 8x8 DCT quantization."""
+    n, h, w = plane.shape; pad_h = -h % 8; pad_w = -w % 8
+    if pad_h or pad_w: plane = F.pad(plane.unsqueeze(1), (0, pad_w, 0, pad_h), mode="replicate").squeeze(1)
+    ph, pw = plane.shape[1], plane.shape[2]
+    blocks = plane.reshape(n, ph // 8, 8, pw // 8, 8).transpose(2, 3)
+    coeffs = dct @ blocks @ dct.T
+    coeffs = torch.round(coeffs / table) * table
+    blocks = dct.T @ coeffs @ dct
+    return blocks.transpose(2, 3).reshape(n, ph, pw)[:, :h, :w]
+
+def simulate_jpeg(x, quality, subsampling):
+    """
+    Approximates a JPEG encode/decode of a (B, H, W, 3) 0-1 tensor without leaving tensor space:
+    YCbCr conversion, chroma subsampling, blockwise 8x8 DCT quantization with the quality-scaled
+    standard tables, then reconstruction with bilinear chroma upsampling.
+    """
+    device = x.device; dct = _dct_matrix(device); b, h, w, _ = x.shape
+    rgb = torch.floor(x.clamp(0.0, 1.0) * 255.0)
+    r, g, bl = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    y = 0.299 * r + 0.587 * g + 0.114 * bl
+    cb = -0.168736 * r - 0.331264 * g + 0.5 * bl
+    cr = 0.5 * r - 0.418688 * g - 0.081312 * bl
+
+    y = _quantize_blocks(y - 128.0, _quality_scaled_table(JPEG_LUMA_TABLE, quality, device), dct) + 128.0
+    chroma_table = _quality_scaled_table(JPEG_CHROMA_TABLE, quality, device)
+    fy, fx = JPEG_CHROMA_FACTORS.get(subsampling, (2, 2)); chroma = torch.stack((cb, cr), dim=1)
+    if fy > 1 or fx > 1:
+        chroma = F.pad(chroma, (0, -w % fx, 0, -h % fy), mode="replicate")
+        chroma = F.avg_pool2d(chroma, kernel_size=(fy, fx))
+    ch, cw = chroma.shape[2], chroma.shape[3]
+    chroma = _quantize_blocks(chroma.reshape(b * 2, ch, cw), chroma_table, dct).reshape(b, 2, ch, cw)
+    if fy > 1 or fx > 1:
+        chroma = F.interpolate(chroma, size=(ch * fy, cw * fx), mode="bilinear", align_corners=False)[:, :, :h, :w]
+    cb, cr = chroma[:, 0], chroma[:, 1]
+
+    out = torch.stack((y + 1.402 * cr, y - 0.344136 * cb - 0.714136 * cr, y + 1.772 * cb), dim=-1)
+    return torch.round(out).clamp_(0.0, 255.0).div_(255.0)
+
+_jpeg_local = threading.local()
+_log = get_logger("ComfySnap.snap_effects")
+_jpeg_pool = None; _jpeg_pool_workers = 0; _jpeg_pool_lock = threading.Lock()
+
+def _get_jpeg_pool(workers):
+    """
+    Returns the shared JPEG thread pool with at least workers threads. It starts with one thread per core
+    and only grows; calls bound their own concurrency by how many tasks they submit. A pool it outgrows
+    is not shut down, as other calls may still be submitting to it, and its threads exit once it is released.
+    """
+    global _jpeg_pool, _jpeg_pool_workers
+    with _jpeg_pool_lock:
+        if _jpeg_pool is None or _jpeg_pool_workers < workers:
+            _jpeg_pool_workers = max(workers, os.cpu_count() or 1)
+            _jpeg_pool = ThreadPoolExecutor(max_workers=_jpeg_pool_workers, thread_name_prefix="comfysnap-jpeg")
+        return _jpeg_pool
+
+def _jpeg_round_trip(frames_u8, index, quality, subsampling):
+    """
+    Encodes one frame of a quantize_batch() buffer and decodes it back over the same frame, reusing this
+    thread's BytesIO buffer. On failure the frame keeps its quantized pixels.
+    """
+    buffer = getattr(_jpeg_local, "buffer", None)
+    if buffer is None: buffer = _jpeg_local.buffer = io.BytesIO()
+    buffer.seek(0); buffer.truncate()
+    try:
+        pil_view(frames_u8, index).save(buffer, format="JPEG", quality=quality, subsampling=subsampling)
+        buffer.seek(0)
+        with Image.open(buffer) as decoded: frames_u8[index, ..., :3] = np.asarray(decoded.convert("RGB"))
+    except Exception as e: _log.warning("jpeg_failed", "JPEG compression step failed", frame=index, error=str(e))
+
+class LowQualityDigitalLook(BaseNode):
+    """
+    Applies simulated low-quality digital camera/Snap effects.
+    Uses an effect_level slider (0=off, 0.5=preset default, 1=max effect).
+    Includes Gaussian noise and JPEG compression.
+    """
+    PRESET_MODES = ["Standard Snap Low Light", "Early 2000s Digital"]
+    JPEG_BACKENDS = ["pillow", "simulated"]
+    COLOR_ENGINES = ["direct", "lut"]
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "image": ("IMAGE",),
+                "preset": (s.PRESET_MODES, {"default": "Standard Snap Low Light"}),
+                "effect_level": ("FLOAT", {"default": 0.5, "min": 0.0, "max": 1.0, "step": 0.01}),
+                "seed": ("INT", { "default": 0, "min": 0, "max": 4294967295 }),
+            },
+            "optional": {
+                "jpeg_backend": (s.JPEG_BACKENDS, {"default": "pillow"}),
+                "jpeg_workers": ("INT", {"default": 0, "min": 0, "max": 64}),
+                "color_engine": (s.COLOR_ENGINES, {"default": "direct"}),
+                **WORKER_INPUTS,
+                **STREAM_INPUTS,
+                **CHUNK_IMAGE_INPUTS,
+                "use_result_cache": ("BOOLEAN", {"default": False}),
+            },
+            "hidden": {**STREAM_HIDDEN_INPUTS},
+        }
+
+    RETURN_TYPES = ("IMAGE",)
+    FUNCTION = "execute"
+    CATEGORY = "ComfySnap"
+
+    @staticmethod
+    def resolve_params(preset: str, effect_level: float):
+        """Interpolates the preset's JPEG quality, noise, saturation and brightness for an effect level."""
+        if preset == "Standard Snap Low Light": base_jpeg_quality = 70; base_noise_std_dev = 8.0; base_saturation = 0.9; base_brightness = 0.95; jpeg_subsampling = 0 # Default (often 4:4:4 or 4:2:2)
+        elif preset == "Early 2000s Digital": base_jpeg_quality = 50; base_noise_std_dev = 15.0; base_saturation = 0.8; base_brightness = 1.0; jpeg_subsampling = 2 # Use 4:2:0 for more color artifacts
+        else: base_jpeg_quality = 75; base_noise_std_dev = 5.0; base_saturation = 1.0; base_brightness = 1.0; jpeg_subsampling = 0
+
+        no_effect_jpeg_q = 95; no_effect_noise = 0.0; no_effect_saturation = 1.0; no_effect_brightness = 1.0
+        max_effect_jpeg_q = 15; max_effect_noise = base_noise_std_dev * 2.5
+        max_effect_saturation = 1.0 + (base_saturation - 1.0) * 1.5; max_effect_brightness = 1.0 + (base_brightness - 1.0) * 1.5
+
+        def interpolate(level, val0, val05, val1):
+            if level <= 0.5: factor = level / 0.5; return val0 + factor * (val05 - val0)
+            else: factor = (level - 0.5) / 0.5; return val05 + factor * (val1 - val05)
+
+        actual_jpeg_quality = interpolate(effect_level, no_effect_jpeg_q, base_jpeg_quality, max_effect_jpeg_q)
+        actual_noise_std_dev = interpolate(effect_level, no_effect_noise, base_noise_std_dev, max_effect_noise)
+        actual_saturation = interpolate(effect_level, no_effect_saturation, base_saturation, max_effect_saturation)
+        actual_brightness = interpolate(effect_level, no_effect_brightness, base_brightness, max_effect_brightness)
+
+        actual_jpeg_quality = int(max(1, min(100, actual_jpeg_quality)))
+        actual_noise_std_dev = max(0.0, actual_noise_std_dev)
+        actual_saturation = max(0.01, actual_saturation); actual_brightness = max(0.01, actual_brightness)
+        return {"jpeg_quality": actual_jpeg_quality, "noise_std_dev": actual_noise_std_dev, "saturation": actual_saturation,
+                "brightness": actual_brightness, "jpeg_subsampling": jpeg_subsampling}
+
+    @classmethod
+    def apply_color(cls, x: torch.Tensor, params: dict, color_engine: str = "direct"):
+        """
+        Applies the preset's saturation and brightness in place to a (..., 3) 0-1 float tensor.
+        The "lut" color engine maps both through one cached ColorLUT.
+        """
+        saturation = params["saturation"]; brightness = params["brightness"]
+        if color_engine == "lut":
+            if abs(saturation - 1.0) > 0.01 or abs(brightness - 1.0) > 0.01: x.copy_(cls.color_lut(params, x.device).apply(x))
+            return x
+        if abs(saturation - 1.0) > 0.01:
+            gray = (x[..., 0:1] * LUMA_WEIGHTS[0] + x[..., 1:2] * LUMA_WEIGHTS[1] + x[..., 2:3] * LUMA_WEIGHTS[2]) / 65536.0
+            x.sub_(gray).mul_(saturation).add_(gray).clamp_(0.0, 1.0)
+        if abs(brightness - 1.0) > 0.01: x.mul_(brightness).clamp_(0.0, 1.0)
+        return x
+
+    @classmethod
+    def color_lut(cls, params: dict, device, before=None, key=(), separable=True):
+        """
+        apply_color() compiled into a ColorLUT, optionally composed after another pointwise transform
+        (before, identified in the LUT cache by key, separable if it acts on each channel on its own).
+        Without a saturation change the result compiles into per-channel curves.
+        """
+        separable = separable and abs(params["saturation"] - 1.0) <= 0.01
+        def transform(x):
+            return cls.apply_color(x.clone() if before is None else before(x), params)
+        return cached_lut(("effects", params["saturation"], params["brightness"]) + tuple(key), transform, separable, device)
+
+    @staticmethod
+    def apply_noise(x: torch.Tensor, params: dict, seed: int, frame_offset: int = 0):
+        """
+        Adds the preset's Gaussian noise in place to a (B, H, W, 3) float tensor. Each frame's noise
+        comes from a local generator seeded with derive_frame_seed(seed, frame_offset + i).
+        """
+        noise_std_dev = params["noise_std_dev"]
+        if noise_std_dev > 0.01 and x.shape[0] > 0:
+            generator = torch.Generator(device=x.device); noise = torch.empty_like(x[0])
+            for i in range(x.shape[0]):
+                generator.manual_seed(derive_frame_seed(seed, frame_offset + i))
+                x[i].add_(noise.normal_(0.0, noise_std_dev / 255.0, generator=generator))
+            x.clamp_(0.0, 1.0)
+        return x
+
+    @classmethod
+    def apply_color_and_noise(cls, x: torch.Tensor, params: dict, seed: int, frame_offset: int = 0, color_engine: str = "direct"):
+        """Applies saturation, brightness and Gaussian noise in place to a (B, H, W, 3) float tensor."""
+        cls.apply_color(x, params, color_engine)
+        return cls.apply_noise(x, params, seed, frame_offset)
+
+    @staticmethod
+    def noise_and_jpeg(x: torch.Tensor, frame_offset: int, params: dict, seed: int, jpeg_backend: str):
+        """The per-frame steps (noise, then the JPEG round trip) for a shard of frames starting at frame_offset, in place."""
+        LowQualityDigitalLook.apply_noise(x, params, seed, frame_offset)
+        if params["jpeg_quality"] < 98:
+            LowQualityDigitalLook.apply_jpeg(x, params["jpeg_quality"], params["jpeg_subsampling"], jpeg_backend, workers=1, out=x)
+        return x
+
+    @staticmethod
+    def apply_jpeg(x: torch.Tensor, quality: int, subsampling: int, backend: str = "pillow", workers: int = 0, out: torch.Tensor = None):
+        """
+        JPEG round-trips every frame of a (B, H, W, 3) 0-1 tensor into out (a new float tensor by default;
+        x itself is allowed). The "pillow" backend encodes frames concurrently on a thread pool (workers=0
+        uses every core, 1 runs serially); "simulated" approximates the artifacts on the batch tensor directly.
+        """
+        if backend == "simulated":
+            result = simulate_jpeg(x, quality, subsampling)
+            return result if out is None else out.copy_(result)
+        # One quantized host copy of the batch: PIL encodes views over it and decodes back into it, so the
+        # batch leaves the tensor's device once and returns in a single upload, whatever the batch size
+        frames_u8 = quantize_batch(x)
+        if out is None: out = torch.empty(x.shape[:-1] + (3,), dtype=torch.float32, device=x.device)
+        batch_size = frames_u8.shape[0]; requested = workers or os.cpu_count() or 1; workers = min(requested, batch_size)
+        if workers <= 1:
+            for i in range(batch_size): _jpeg_round_trip(frames_u8, i, quality, subsampling)
+        else:
+            # Pillow's codec releases the GIL, so threads encode in parallel. The batch is split into one contiguous
+            # range of frames per worker, so a call never runs more tasks at once than it asked for; each task owns
+            # its frames of the buffer
+            def round_trips(start, end):
+                for i in range(start, end): _jpeg_round_trip(frames_u8, i, quality, subsampling)
+            pool = _get_jpeg_pool(requested)
+            list(pool.map(lambda bounds: round_trips(*bounds), shard_bounds(batch_size, workers)))
+        return upload_batch(frames_u8, out)
+
+    @result_cached
+    def execute(self, image: torch.Tensor, preset: str, effect_level: float = 0.5, seed: int = 0,
+                jpeg_backend: str = "pillow", jpeg_workers: int = 0,
+                chunk_size: int = 0, max_memory_mb: int = 0, mmap_dir: str = "", color_engine: str = "direct",
+                process_workers: int = 0, stream_id: str = "", stream_reset: bool = False, unique_id: str = None):
+        if color_engine not in self.COLOR_ENGINES:
+            raise ValueError(f"Invalid color engine '{color_engine}'. Valid options are: {self.COLOR_ENGINES}.")
+        # In a stream, frames are numbered from the stream's start, so every batch gets fresh noise
+        session = stream_session(stream_id, stream_reset)
+        first_frame = session.claim(stream_consumer(self, unique_id), image.shape[0]) if session is not None else 0
+        effect_level = max(0.0, min(1.0, effect_level))
+        if effect_level <= 0.001: return (image,)
+        seed = max(0, min(4294967295, seed))
+        params = self.resolve_params(preset, effect_level)
+
+        # With process_workers > 1 (and a CPU batch) the per-frame steps run on the process pool of snap_workers
+        sharded = process_workers > 1 and image.device.type == "cpu" and image.shape[0] > 1
+
+        # Saturation, brightness and noise run on whole chunks of frames (the whole batch by default);
+        # only the JPEG step leaves tensor space. Noise is seeded per absolute frame index, so chunking doesn't change it.
+        def process(start, end, out):
+            pixel_count = (end - start) * image.shape[1] * image.shape[2]
+            with self.stage("conversion", 12 * pixel_count):
+                x = out.copy_(image[start:end, ..., :3]).clamp_(0.0, 1.0) if out is not None else image[start:end, ..., :3].to(torch.float32).clamp(0.0, 1.0)
+            if sharded:
+                # Noise and JPEG are per-frame work, split across the worker processes; each frame's noise is
+                # still seeded by its absolute index, so the result equals the in-process one
+                with self.stage("color", 12 * pixel_count):
+                    self.apply_color(x, params, color_engine)
+                with self.stage("workers", 4 * 3 * pixel_count):
+                    run_sharded(x, self.noise_and_jpeg, (params, seed, jpeg_backend), process_workers, frame_offset=first_frame + start)
+                return x
+            with self.stage("noise", 12 * pixel_count):
+                self.apply_color_and_noise(x, params, seed, frame_offset=first_frame + start, color_engine=color_engine)
+            if params["jpeg_quality"] < 98:
+                # The Pillow backend stages the chunk in an 8-bit RGBX host buffer
+                with self.stage("jpeg", 4 * pixel_count if jpeg_backend != "simulated" else 0):
+                    self.apply_jpeg(x, params["jpeg_quality"], params["jpeg_subsampling"], jpeg_backend, jpeg_workers, out=x)
+            return x
+        output_tensor = process_in_chunks(image.shape[0], image.shape[1:3] + (3,), image.device, process, chunk_size, max_memory_mb, mmap_dir)
+        return (output_tensor,)
+
+NODE_CLASS_MAPPINGS = { "LowQualityDigitalLook": LowQualityDigitalLook }
 NODE_DISPLAY_NAME_MAPPINGS = { "LowQualityDigitalLook": "Low Quality Digital Look" }
\ No newline at end of file
@@ -1,93 +1,226 @@
-# File: snap_filters.py
-import torch
-import numpy as np
-from PIL import Image, ImageEnhance, ImageOps
-import random
-
-class SnapBasicFilters:
-    """
-    Applies basic Snap-style color filters to an image,
-    with options to randomize filter type and strength.
-    """
-    FILTER_TYPES = ["original", "grayscale", "vivid", "cooler", "warmer", "brighter", "darker"]
-
-    @classmethod
-    def INPUT_TYPES(s):
-        return {
-            "required": {
-                "image": ("IMAGE",),
-                "filter_type": (s.FILTER_TYPES, {"default": "original"}),
-                "strength": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.01}),
-                "randomize_filter": ("BOOLEAN", {"default": False}),
-                "randomize_strength": ("BOOLEAN", {"default": False}),
-                "random_strength_min": ("FLOAT", {"default": 0.5, "min": 0.0, "max": 1.0, "step": 0.01}),
-                "random_strength_max": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.01}),
-                "seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}),
-            }
-        }
-
-    RETURN_TYPES = ("IMAGE",)
-    FUNCTION = "execute"
-    CATEGORY = "ComfySnap"
-
-    def execute(self, image: torch.Tensor, filter_type: str, strength: float,
-                     randomize_filter: bool, randomize_strength: bool, seed: int,
-                     random_strength_min: float, random_strength_max: float):
-
-        # Add validation for filter type
-        if filter_type not in self.FILTER_TYPES:
-            raise ValueError(f"Invalid filter type '{filter_type}'. Valid options are: {self.FILTER_TYPES}.")
-
-        actual_filter_type = filter_type; actual_strength = strength
-        if randomize_filter or randomize_strength: random.seed(seed)
-        if randomize_filter:
-            available_filters = [f for f in self.FILTER_TYPES if f != "original"]
-            if available_filters: actual_filter_type = random.choice(available_filters)
-            else: actual_filter_type = "original"
-        if randomize_strength:
-            min_s = min(random_strength_min, random_strength_max); max_s = max(random_strength_min, random_strength_max)
-            actual_strength = random.uniform(min_s, max_s)
-        actual_strength = max(0.0, min(1.0, actual_strength))
-
-        if (actual_filter_type == "original" and actual_strength >= 1.0) or actual_strength <= 0.001: return (image,)
-
-        batch_size, img_height, img_width, channels = image.shape; output_images = []
-        for i in range(batch_size):
-            img_pil_rgb = Image.fromarray((image[i].cpu().numpy() * 255).astype(np.uint8)).convert('RGB')
-            original_img_pil = img_pil_rgb.copy(); filtered_img_pil = img_pil_rgb
-
-            if actual_filter_type != "original":
-                try:
-                    if actual_filter_type == "grayscale":
-                        filtered_img_pil = ImageOps.grayscale(img_pil_rgb).convert('RGB')
-                    elif actual_filter_type == "vivid":
-                        enhancer_c = ImageEnhance.Contrast(filtered_img_pil); filtered_img_pil = enhancer_c.enhance(1.3)
-                        enhancer_s = ImageEnhance.Color(filtered_img_pil); filtered_img_pil = enhancer_s.enhance(1.3)
-                    elif actual_filter_type == "cooler":
-                        # Reverted to alpha blend method for a subtle tint
-                        temp_rgba = filtered_img_pil.convert("RGBA")
-                        # Slightly less intense blue tint (alpha 30 / 255 approx 12%)
-                        blue_tint = Image.new("RGBA", filtered_img_pil.size, (120, 150, 255, 30))
-                        filtered_img_pil = Image.alpha_composite(temp_rgba, blue_tint).convert("RGB")
-                    elif actual_filter_type == "warmer":
-                        # Reverted to alpha blend method for a subtle tint
-                        temp_rgba = filtered_img_pil.convert("RGBA")
-                        # Slightly less intense orange tint (alpha 30 / 255 approx 12%)
-                        orange_tint = Image.new("RGBA", filtered_img_pil.size, (255, 180, 100, 30))
-                        filtered_img_pil = Image.alpha_composite(temp_rgba, orange_tint).convert("RGB")
-                    elif actual_filter_type == "brighter":
-                        enhancer = ImageEnhance.Brightness(filtered_img_pil); filtered_img_pil = enhancer.enhance(1.25)
-                    elif actual_filter_type == "darker":
-                        enhancer_b = ImageEnhance.Brightness(filtered_img_pil); filtered_img_pil = enhancer_b.enhance(0.8)
-                        enhancer_c = ImageEnhance.Contrast(filtered_img_pil); filtered_img_pil = enhancer_c.enhance(1.1)
-                    else: filtered_img_pil = original_img_pil
-                except Exception as e: print(f"Error applying filter '{actual_filter_type}': {e}"); filtered_img_pil = original_img_pil
-
-            final_img_pil = Image.blend(original_img_pil, filtered_img_pil, actual_strength)
-            output_img_np = np.array(final_img_pil).astype(np.float32) / 255.0
-            output_images.append(torch.from_numpy(output_img_np))
-        output_tensor = torch.stack(output_images)
-        return (output_tensor,)
-
-NODE_CLASS_MAPPINGS = { "SnapBasicFilters": SnapBasicFilters }
+# File: snap_filters.py
+import torch
+import random
+from .base_node import BaseNode
+from .utils import derive_frame_seed, process_in_chunks, CHUNK_IMAGE_INPUTS, result_cached
+from .snap_stream import STREAM_INPUTS, STREAM_HIDDEN_INPUTS, stream_session, stream_consumer
+from .color_lut import cached_lut, frame_mean_levels, apply_grouped
+
+# ITU-R 601-2 luma weights in the same 16-bit fixed point Pillow uses for convert("L")
+LUMA_WEIGHTS = (19595, 38470, 7471)
+# Tint overlays for the cooler/warmer filters: (RGB, alpha 0-255)
+TINTS = {"cooler": ((120, 150, 255), 30), "warmer": ((255, 180, 100), 30)}
+# Filters whose output channels each depend only on the same input channel (and the frame mean), so the
+# LUT engine compiles them into 1D curves; the others need a 3D LUT
+SEPARABLE_FILTERS = {"brighter", "darker", "cooler", "warmer"}
+# Filters that go through ImageEnhance.Contrast and so depend on the frame's mean luma
+MEAN_FILTERS = {"vivid", "darker"}
+
+def _settle(x, compat):
+    """Clamps to the valid range; in PIL-compatible mode also truncates to whole 8-bit levels like Pillow's blend."""
+    if compat: return torch.clamp(x, 0.0, 255.0).trunc_()
+    return torch.clamp(x, 0.0, 1.0)
+
+def _luma(x, compat):
+    """Grayscale of an (..., 3) tensor, keeping a trailing channel dim of 1."""
+    r, g, b = x[..., 0:1], x[..., 1:2], x[..., 2:3]
+    if compat: return torch.floor((r * LUMA_WEIGHTS[0] + g * LUMA_WEIGHTS[1] + b * LUMA_WEIGHTS[2] + 32768.0) / 65536.0)
+    return (r * LUMA_WEIGHTS[0] + g * LUMA_WEIGHTS[1] + b * LUMA_WEIGHTS[2]) / 65536.0
+
+def _enhance(degenerate, x, factor, compat):
+    """ImageEnhance semantics: extrapolate from a degenerate image towards x by factor."""
+    return _settle(degenerate + factor * (x - degenerate), compat)
+
+def _contrast(x, factor, compat, mean=None):
+    # ImageEnhance.Contrast degenerates to a flat image at the (per-frame) mean luma, unless a mean is given
+    if mean is not None: return _enhance(mean, x, factor, compat)
+    mean = _luma(x, compat).double().mean(dim=(-3, -2), keepdim=True)
+    if compat: mean = torch.floor(mean + 0.5)
+    return _enhance(mean.to(x.dtype), x, factor, compat)
+
+def _tint(x, tint, compat):
+    # Image.alpha_composite of a flat RGBA tint over an opaque frame, which rounds to nearest
+    color, alpha = tint; a = alpha / 255.0
+    color = torch.tensor(color, dtype=x.dtype, device=x.device)
+    if compat: return torch.floor((color * alpha + x * (255 - alpha)) / 255.0 + 0.5)
+    return torch.clamp(x * (1.0 - a) + (color / 255.0) * a, 0.0, 1.0)
+
+def filter_frames(x, filter_type, compat=False, frame_mean=None):
+    """
+    Applies one of SnapBasicFilters.FILTER_TYPES to a (..., H, W, 3) tensor.
+    Values are 0-1 floats, or whole 0-255 levels when compat is True.
+    frame_mean (float mode only) fixes the input frame's mean luma instead of measuring x, as when compiling a LUT.
+    """
+    if filter_type == "grayscale": return _luma(x, compat).expand_as(x)
+    if filter_type == "vivid": x = _contrast(x, 1.3, compat, frame_mean); return _enhance(_luma(x, compat), x, 1.3, compat)
+    if filter_type in TINTS: return _tint(x, TINTS[filter_type], compat)
+    if filter_type == "brighter": return _settle(x * 1.25, compat)
+    # Scaling by 0.8 never clips, so the darkened frame's mean is exactly 0.8 times the input's
+    if filter_type == "darker": x = _settle(x * 0.8, compat); return _contrast(x, 1.1, compat, None if frame_mean is None else 0.8 * frame_mean)
+    return x
+
+def filter_transform(filter_type, strength, frame_mean=None):
+    """A float-mode filter blended at strength, as a function of 0-1 RGB for compiling into a ColorLUT."""
+    return lambda x: _settle(x + strength * (filter_frames(x, filter_type, False, frame_mean) - x), False)
+
+def filter_lut_key(filter_type, strength, mean_level):
+    """LUT_CACHE key of a filter; mean_level only matters for MEAN_FILTERS."""
+    return ("filter", filter_type, float(strength), mean_level if filter_type in MEAN_FILTERS else None)
+
+def filter_lut(key, device):
+    """The compiled ColorLUT for a filter_lut_key()."""
+    _, filter_type, strength, mean_level = key
+    frame_mean = None if mean_level is None else mean_level / 255.0
+    return cached_lut(key, filter_transform(filter_type, strength, frame_mean), filter_type in SEPARABLE_FILTERS, device)
+
+def apply_filter_lut(image, frame_filters, frame_strengths):
+    """
+    Float-precision filtering through compiled LUTs: one lookup per pixel, with frames that share
+    a filter, strength and (for MEAN_FILTERS) 8-bit mean luma sharing one cached LUT.
+    """
+    x = image[..., :3].to(torch.float32).clamp(0.0, 1.0)
+    means = frame_mean_levels(x, LUMA_WEIGHTS) if MEAN_FILTERS.intersection(frame_filters) else [None] * x.shape[0]
+    keys = [filter_lut_key(f, s, m) for f, s, m in zip(frame_filters, frame_strengths, means)]
+    return apply_grouped(x, keys, lambda key: filter_lut(key, x.device))
+
+def apply_filter(image, filter_type, strength, compat=False):
+    """
+    Filters a (B, H, W, C) image batch on its own device and blends the result with
+    the original by strength (a float or a tensor broadcastable against the batch).
+    With compat=True every step is quantized exactly like the Pillow implementation,
+    so the output matches it to within 1/255 per channel.
+    """
+    x = image[..., :3].to(torch.float32)
+    if compat: x = torch.trunc(torch.clamp(x, 0.0, 1.0) * 255.0)
+    filtered = filter_frames(x, filter_type, compat)
+    out = _settle(x + strength * (filtered - x), compat)
+    if compat: out = out / 255.0
+    return out
+
+def apply_filter_per_frame(image, frame_filters, frame_strengths, compat=False):
+    """
+    Filters every frame with its own filter type and strength. Frames that share a
+    filter are gathered into one sub-batch, so the cost is one vectorized pass per
+    distinct filter rather than one per frame.
+    """
+    batch_size = image.shape[0]
+    strengths = torch.tensor(frame_strengths, dtype=torch.float32, device=image.device).view(-1, 1, 1, 1)
+    out = torch.empty(image.shape[:-1] + (3,), dtype=torch.float32, device=image.device)
+    for filter_type in dict.fromkeys(frame_filters):
+        indices = [i for i, f in enumerate(frame_filters) if f == filter_type]
+        if len(indices) == batch_size: return apply_filter(image, filter_type, strengths, compat)
+        idx = torch.tensor(indices, dtype=torch.long, device=image.device)
+        out[idx] = apply_filter(image[idx], filter_type, strengths[idx], compat)
+    return out
+
+class SnapBasicFilters(BaseNode):
+    """
+    Applies basic Snap-style color filters to an image,
+    with options to randomize filter type and strength.
+    """
+    FILTER_TYPES = ["original", "grayscale", "vivid", "cooler", "warmer", "brighter", "darker"]
+    PRECISION_MODES = ["float", "pil_compatible"]
+    COLOR_ENGINES = ["direct", "lut"]
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "image": ("IMAGE",),
+                "filter_type": (s.FILTER_TYPES, {"default": "original"}),
+                "strength": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.01}),
+                "randomize_filter": ("BOOLEAN", {"default": False}),
+                "randomize_strength": ("BOOLEAN", {"default": False}),
+                "random_strength_min": ("FLOAT", {"default": 0.5, "min": 0.0, "max": 1.0, "step": 0.01}),
+                "random_strength_max": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.01}),
+                "seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}),
+            },
+            "optional": {
+                "precision": (s.PRECISION_MODES, {"default": "float"}),
+                "randomize_per_frame": ("BOOLEAN", {"default": False}),
+                "color_engine": (s.COLOR_ENGINES, {"default": "direct"}),
+                **STREAM_INPUTS,
+                **CHUNK_IMAGE_INPUTS,
+                "use_result_cache": ("BOOLEAN", {"default": False}),
+            },
+            "hidden": {**STREAM_HIDDEN_INPUTS},
+        }
+
+    RETURN_TYPES = ("IMAGE", "STRING", "STRING")
+    RETURN_NAMES = ("image", "filters", "strengths")
+    FUNCTION = "execute"
+    CATEGORY = "ComfySnap"
+
+    @result_cached
+    def execute(self, image: torch.Tensor, filter_type: str, strength: float,
+                     randomize_filter: bool, randomize_strength: bool, seed: int,
+                     random_strength_min: float, random_strength_max: float, precision: str = "float",
+                     randomize_per_frame: bool = False, chunk_size: int = 0, max_memory_mb: int = 0, mmap_dir: str = "",
+                     color_engine: str = "direct", stream_id: str = "", stream_reset: bool = False, unique_id: str = None):
+
+        # Add validation for filter type
+        if filter_type not in self.FILTER_TYPES:
+            raise ValueError(f"Invalid filter type '{filter_type}'. Valid options are: {self.FILTER_TYPES}.")
+        if precision not in self.PRECISION_MODES:
+            raise ValueError(f"Invalid precision '{precision}'. Valid options are: {self.PRECISION_MODES}.")
+        if color_engine not in self.COLOR_ENGINES:
+            raise ValueError(f"Invalid color engine '{color_engine}'. Valid options are: {self.COLOR_ENGINES}.")
+
+        batch_size = image.shape[0]; compat = precision == "pil_compatible"
+        # pil_compatible stays on the exact direct path; LUTs interpolate between lattice points
+        use_lut = color_engine == "lut" and not compat
+        chunking = (image.shape[1:3] + (3,), image.device, chunk_size, max_memory_mb, mmap_dir)
+        min_s = min(random_strength_min, random_strength_max); max_s = max(random_strength_min, random_strength_max)
+        available_filters = [f for f in self.FILTER_TYPES if f != "original"]
+
+        session = stream_session(stream_id, stream_reset)
+        first_frame = session.claim(stream_consumer(self, unique_id), batch_size) if session is not None else 0
+
+        if randomize_per_frame and (randomize_filter or randomize_strength):
+            # One draw per frame, seeded by its absolute frame index, so a stream continues the sequence across batches
+            # and a stream of one batch draws what the same batch does outside a stream; frames are then filtered in
+            # per-filter groups
+            frame_filters = [filter_type] * batch_size; frame_strengths = [strength] * batch_size
+            generators = [random.Random(derive_frame_seed(seed, first_frame + i)) for i in range(batch_size)]
+            if randomize_filter: frame_filters = [rng.choice(available_filters) for rng in generators]
+            if randomize_strength: frame_strengths = [rng.uniform(min_s, max_s) for rng in generators]
+            frame_strengths = [max(0.0, min(1.0, s)) for s in frame_strengths]
+            if use_lut: filter_chunk = lambda start, end: apply_filter_lut(image[start:end], frame_filters[start:end], frame_strengths[start:end])
+            else: filter_chunk = lambda start, end: apply_filter_per_frame(image[start:end], frame_filters[start:end], frame_strengths[start:end], compat)
+            output_tensor = self.run_chunked(batch_size, filter_chunk, *chunking)
+            return (output_tensor,) + self.format_choices(frame_filters, frame_strengths)
+
+        actual_filter_type = filter_type; actual_strength = strength
+        rng = random.Random(seed)
+        if randomize_filter:
+            if available_filters: actual_filter_type = rng.choice(available_filters)
+            else: actual_filter_type = "original"
+        if randomize_strength:
+            actual_strength = rng.uniform(min_s, max_s)
+        actual_strength = max(0.0, min(1.0, actual_strength))
+        choices = self.format_choices([actual_filter_type] * batch_size, [actual_strength] * batch_size)
+
+        if (actual_filter_type == "original" and actual_strength >= 1.0) or actual_strength <= 0.001: return (image,) + choices
+
+        if use_lut: filter_chunk = lambda start, end: apply_filter_lut(image[start:end], [actual_filter_type] * (end - start), [actual_strength] * (end - start))
+        else: filter_chunk = lambda start, end: apply_filter(image[start:end], actual_filter_type, actual_strength, compat)
+        output_tensor = self.run_chunked(batch_size, filter_chunk, *chunking)
+        return (output_tensor,) + choices
+
+    def run_chunked(self, batch_size, filter_chunk, frame_shape, device, chunk_size, max_memory_mb, mmap_dir):
+        """Filters the batch in chunks of frames (all at once by default) into one preallocated output."""
+        frame_bytes = 4 * frame_shape[0] * frame_shape[1] * frame_shape[2]
+
+        def process(start, end, out):
+            with self.stage("filter", frame_bytes * (end - start)): return filter_chunk(start, end)
+
+        # The filters keep about six frame-sized temporaries alive per frame
+        return process_in_chunks(batch_size, frame_shape, device, process, chunk_size, max_memory_mb, mmap_dir, work_factor=6)
+
+    @staticmethod
+    def format_choices(frame_filters, frame_strengths):
+        """Comma-separated per-frame filter names and strengths, for reproducing a run."""
+        return ",".join(frame_filters), ",".join(f"{s:.4f}" for s in frame_strengths)
+
+NODE_CLASS_MAPPINGS = { "SnapBasicFilters": SnapBasicFilters }
 NODE_DISPLAY_NAME_MAPPINGS = { "SnapBasicFilters": "Snap Basic Filters" }
\ No newline at end of file
@@ -0,0 +1,130 @@
+# File: snap_pipeline.py
+import torch
+from .base_node import BaseNode
+from .snap_filters import SnapBasicFilters, apply_filter, apply_filter_lut, filter_lut_key, filter_transform, LUMA_WEIGHTS, MEAN_FILTERS, SEPARABLE_FILTERS
+from .color_lut import frame_mean_levels, apply_grouped
+from .snap_effects import LowQualityDigitalLook
+from .snap_text import SnapTextOverlay
+from .snap_stream import STREAM_INPUTS, STREAM_HIDDEN_INPUTS, stream_session, stream_consumer
+
+class SnapPipeline(BaseNode):
+    """
+    Runs SnapBasicFilters, LowQualityDigitalLook and SnapTextOverlay as stages of one node.
+    All stages work in place on a single float working buffer, which is the node's only
+    output allocation; the image is quantized to 8 bits at most once (for a Pillow JPEG step).
+    With the "lut" color engine a filter stage directly followed by effects runs as one fused LUT pass.
+    """
+    STAGES = ["filter", "effects", "text"]
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "image": ("IMAGE",),
+                "stages": ("STRING", {"default": "filter, effects, text", "multiline": False}),
+                "filter_type": (SnapBasicFilters.FILTER_TYPES, {"default": "original"}),
+                "filter_strength": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.01}),
+                "preset": (LowQualityDigitalLook.PRESET_MODES, {"default": "Standard Snap Low Light"}),
+                "effect_level": ("FLOAT", {"default": 0.5, "min": 0.0, "max": 1.0, "step": 0.01}),
+                "seed": ("INT", { "default": 0, "min": 0, "max": 4294967295 }),
+                "jpeg_backend": (LowQualityDigitalLook.JPEG_BACKENDS, {"default": "pillow"}),
+                "text": ("STRING", {"default": "Your Text Here", "multiline": True}),
+                "font_name": ("STRING", {"default": "arial.ttf"}),
+                "font_size_ratio": ("FLOAT", {"default": 0.05, "min": 0.01, "max": 0.2, "step": 0.005}),
+                "vertical_placement": (["top", "middle", "bottom", "custom"], {"default": "middle"}),
+                "custom_vertical_percentage": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 100.0, "step": 0.1}),
+                "text_color": ("STRING", {"default": "#FFFFFF", "multiline": False}),
+                "vertical_padding_ratio_of_size": ("FLOAT", {"default": 0.7, "min": 0.0, "max": 3.0, "step": 0.05}),
+                "line_spacing": ("INT", {"default": 4, "min": 0, "max": 50, "step": 1}),
+                "bar_color": ("STRING", {"default": "#000000", "multiline": False}),
+                "bar_alpha": ("FLOAT", {"default": 0.5, "min": 0.0, "max": 1.0, "step": 0.01}),
+            },
+            "optional": {
+                "color_engine": (SnapBasicFilters.COLOR_ENGINES, {"default": "direct"}),
+                **STREAM_INPUTS,
+            },
+            "hidden": {**STREAM_HIDDEN_INPUTS},
+        }
+
+    RETURN_TYPES = ("IMAGE",)
+    FUNCTION = "execute"
+    CATEGORY = "ComfySnap"
+
+    @classmethod
+    def parse_stages(cls, stages: str):
+        """Splits an ordered stage list such as "filter, effects, text" or "filter > text"."""
+        names = [name.strip().lower() for name in stages.replace(">", ",").replace("\n", ",").split(",") if name.strip()]
+        for name in names:
+            if name not in cls.STAGES: raise ValueError(f"Invalid stage '{name}'. Valid options are: {cls.STAGES}.")
+        return names
+
+    @staticmethod
+    def filter_lut_pass(x: torch.Tensor, filter_type: str, strength: float, params: dict = None):
+        """
+        The filter stage through compiled LUTs. Given the effects' params, their saturation and brightness
+        are folded into the same LUTs, so both stages cost one lookup per pixel.
+        """
+        frame_count = x.shape[0]
+        if params is None: return apply_filter_lut(x, [filter_type] * frame_count, [strength] * frame_count)
+        means = frame_mean_levels(x, LUMA_WEIGHTS) if filter_type in MEAN_FILTERS else [None] * frame_count
+        keys = [filter_lut_key(filter_type, strength, mean) for mean in means]
+
+        def build(key):
+            before = filter_transform(filter_type, strength, None if key[3] is None else key[3] / 255.0)
+            return LowQualityDigitalLook.color_lut(params, x.device, before, key, separable=filter_type in SEPARABLE_FILTERS)
+        return apply_grouped(x, keys, build)
+
+    def execute(self, image: torch.Tensor, stages: str, filter_type: str, filter_strength: float,
+                preset: str, effect_level: float, seed: int, jpeg_backend: str,
+                text: str, font_name: str, font_size_ratio: float, vertical_placement: str,
+                custom_vertical_percentage: float, text_color: str, vertical_padding_ratio_of_size: float,
+                line_spacing: int, bar_color: str, bar_alpha: float, color_engine: str = "direct",
+                stream_id: str = "", stream_reset: bool = False, unique_id: str = None):
+
+        if len(image.shape) != 4:
+            raise ValueError("Input image must be a 4D tensor with shape (batch_size, height, width, channels).")
+        if filter_type not in SnapBasicFilters.FILTER_TYPES:
+            raise ValueError(f"Invalid filter type '{filter_type}'. Valid options are: {SnapBasicFilters.FILTER_TYPES}.")
+        if color_engine not in SnapBasicFilters.COLOR_ENGINES:
+            raise ValueError(f"Invalid color engine '{color_engine}'. Valid options are: {SnapBasicFilters.COLOR_ENGINES}.")
+        stage_names = self.parse_stages(stages)
+        # In a stream, noise continues from the stream's frame index and caption sprites stay in the stream's cache
+        session = stream_session(stream_id, stream_reset)
+        first_frame = session.claim(stream_consumer(self, unique_id), image.shape[0]) if session is not None else 0
+        if not stage_names or image.shape[0] == 0: return (image,)
+
+        # The one working buffer every stage reads and writes
+        with self.stage("conversion", 4 * image[..., :3].numel()):
+            working = image[..., :3].to(torch.float32, copy=True).clamp_(0.0, 1.0)
+        level = max(0.0, min(1.0, effect_level))
+        fused_color = False  # the effects' color step already ran inside the filter stage's LUT
+        for position, stage in enumerate(stage_names):
+            if stage == "filter":
+                strength = max(0.0, min(1.0, filter_strength))
+                if filter_type == "original" or strength <= 0.001: continue
+                with self.stage("filter", 4 * working.numel()):
+                    if color_engine == "lut":
+                        fuse = stage_names[position + 1:position + 2] == ["effects"] and level > 0.001
+                        params = LowQualityDigitalLook.resolve_params(preset, level) if fuse else None
+                        working.copy_(self.filter_lut_pass(working, filter_type, strength, params)); fused_color = fuse
+                    else:
+                        working.copy_(apply_filter(working, filter_type, strength))
+            elif stage == "effects":
+                if level <= 0.001: continue
+                params = LowQualityDigitalLook.resolve_params(preset, level); seed = max(0, min(4294967295, seed))
+                with self.stage("noise"):
+                    if fused_color: LowQualityDigitalLook.apply_noise(working, params, seed, first_frame)
+                    else: LowQualityDigitalLook.apply_color_and_noise(working, params, seed, first_frame, color_engine=color_engine)
+                fused_color = False
+                if params["jpeg_quality"] < 98:
+                    with self.stage("jpeg", working.numel() // 3 * 4 if jpeg_backend != "simulated" else 0):
+                        LowQualityDigitalLook.apply_jpeg(working, params["jpeg_quality"], params["jpeg_subsampling"], jpeg_backend, out=working)
+            elif stage == "text":
+                SnapTextOverlay().overlay_into(working, text, font_name, font_size_ratio, vertical_padding_ratio_of_size, line_spacing,
+                                               vertical_placement, custom_vertical_percentage, text_color, bar_color, bar_alpha,
+                                               sprite_cache=session.sprites if session is not None else None,
+                                               stage_timer=self.stage)
+        return (working,)
+
+NODE_CLASS_MAPPINGS = { "SnapPipeline": SnapPipeline }
+NODE_DISPLAY_NAME_MAPPINGS = { "SnapPipeline": "Snap Pipeline" }
\ No newline at end of file
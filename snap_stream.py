@@ -0,0 +1,121 @@
+# File: snap_stream.py
+# Streaming mode: sessions that carry frame indices and temporal state across sequential batches of one stream
+import threading
+import torch
+from .utils import LRUCache
+
+# Optional node inputs joining a call to a stream; "" keeps the node stateless
+STREAM_INPUTS = {
+    "stream_id": ("STRING", {"default": "", "multiline": False}),
+    "stream_reset": ("BOOLEAN", {"default": False}),
+}
+# Hidden input through which ComfyUI passes the node's id in the graph, which keys the node's place in a stream
+STREAM_HIDDEN_INPUTS = {
+    "unique_id": "UNIQUE_ID",
+}
+# Open streams by id; the least recently used session is dropped past max_entries
+STREAM_SESSIONS = LRUCache(max_entries=64)
+
+
+class StreamSession:
+    """
+    State of one stream of frames that arrives in sequential batches.
+
+    Every node taking part keeps its own position in the stream (see stream_consumer()), so nodes of
+    the same type can share a stream id: claim() returns the absolute index of a batch's first frame,
+    so per-frame seeds continue where the previous batch stopped instead of starting over. Values a node
+    carries from one batch to the next (smoothing state, the chosen text renderer) live in state(), and
+    the stream's caption sprites in its own cache, so a long stream neither churns the shared caches nor
+    loses its sprites to other work.
+
+    Args:
+        stream_id (str): The id the session is registered under.
+        max_sprites (int): Caption sprites kept for the stream.
+    """
+    def __init__(self, stream_id, max_sprites=32):
+        self.stream_id = stream_id
+        self.sprites = LRUCache(max_sprites)
+        self._lock = threading.Lock()
+        self._positions = {}
+        self._state = {}
+
+    def claim(self, consumer, frame_count):
+        """Returns the absolute index of the first of frame_count new frames for consumer and moves past them."""
+        with self._lock:
+            start = self._positions.get(consumer, 0)
+            self._positions[consumer] = start + frame_count
+            return start
+
+    def position(self, consumer):
+        """Absolute index of the next frame consumer will see."""
+        with self._lock:
+            return self._positions.get(consumer, 0)
+
+    def state(self, consumer):
+        """The mutable dict of values consumer carries from one batch to the next."""
+        with self._lock:
+            return self._state.setdefault(consumer, {})
+
+    def reset(self):
+        """Starts the stream over from frame 0 with no carried state."""
+        with self._lock:
+            self._positions.clear(); self._state.clear()
+        self.sprites.clear()
+
+
+def stream_session(stream_id, reset=False):
+    """
+    Returns the StreamSession for stream_id, created on first use, or None for "" (no stream).
+    reset=True starts the stream over from frame 0.
+    """
+    if not stream_id: return None
+    session = STREAM_SESSIONS.get_or_create(stream_id, lambda: StreamSession(stream_id))
+    if reset: session.reset()
+    return session
+
+
+def stream_consumer(node, unique_id=None):
+    """
+    The key a node's position and carried state are kept under in a session: its id in the ComfyUI graph,
+    which survives ComfyUI recreating the node object, or the node instance when it is called directly.
+    """
+    return ("node", str(unique_id)) if unique_id is not None else ("instance", id(node))
+
+
+def close_stream(stream_id):
+    """Drops a stream's session and everything it holds; the id starts a new stream when used again."""
+    STREAM_SESSIONS.pop(stream_id)
+
+
+def batched(frames, batch_size, frame_dims=3):
+    """
+    Regroups an iterable of single frames and/or batches into batches of batch_size frames (the last
+    one may be shorter), holding at most one batch at a time. A frame has frame_dims dimensions:
+    3 for images ((H, W, C), batches (B, H, W, C)), 2 for masks.
+    """
+    pending = []; count = 0
+    for item in frames:
+        item = item.unsqueeze(0) if item.dim() == frame_dims else item
+        while item.shape[0] > 0:
+            take = min(batch_size - count, item.shape[0])
+            pending.append(item[:take]); count += take; item = item[take:]
+            if count == batch_size:
+                yield torch.cat(pending) if len(pending) > 1 else pending[0]
+                pending = []; count = 0
+    if pending: yield torch.cat(pending) if len(pending) > 1 else pending[0]
+
+
+def iterate_stream(node, batches, stream_id, *args, resume=False, **kwargs):
+    """
+    Runs node.execute() over an iterable of batches as one stream and yields each batch's outputs as
+    soon as they are ready, so memory stays bounded by a single batch. The stream starts at frame 0
+    unless resume is True. Extra arguments are passed to every execute() call.
+
+        node = LowQualityDigitalLook()
+        for (frames,) in iterate_stream(node, batched(reader, 16), "clip-1", "Early 2000s Digital", 0.5, 42):
+            writer.write(frames)
+    """
+    reset = not resume
+    for batch in batches:
+        yield node.execute(batch, *args, stream_id=stream_id, stream_reset=reset, **kwargs)
+        reset = False
@@ -1,176 +1,547 @@
-# File: snap_text.py
-import torch
-import numpy as np
-from PIL import Image, ImageDraw, ImageFont
-import os
-from .utils import hex_to_rgb  
-
-class SnapTextOverlay:
-    """
-    Applies a basic Snap-style text overlay with a semi-transparent bar.
-    Supports text wrapping and various placement options.
-    """
-
-    @staticmethod
-    def wrap_text_pixel_width(draw, text, font, max_width):
-        lines = [];
-        if not text or max_width <= 0 or not hasattr(font, 'size'): return lines
-        paragraphs = text.split('\n'); all_lines = []
-        for paragraph in paragraphs:
-            if not paragraph.strip(): all_lines.append(""); continue
-            words = paragraph.split(' '); current_line = ""
-            for word in words:
-                word = word.strip();
-                if not word: continue
-                test_line = current_line + (" " if current_line else "") + word; line_width = 0
-                try: bbox = draw.textbbox((0, 0), test_line, font=font, anchor="lt"); line_width = bbox[2] - bbox[0]
-                except Exception as e: line_width = len(test_line) * font.size * 0.6
-                if line_width <= max_width: current_line = test_line
-                else:
-                    if current_line: all_lines.append(current_line)
-                    try: word_bbox = draw.textbbox((0,0), word, font=font, anchor='lt'); current_word_width = word_bbox[2]-word_bbox[0]
-                    except: current_word_width = len(word) * font.size * 0.6
-                    if current_word_width > max_width:
-                        temp_word = "";
-                        for i, char in enumerate(word):
-                             try: char_bbox = draw.textbbox((0,0), temp_word + char, font=font, anchor='lt'); current_width = char_bbox[2]-char_bbox[0]
-                             except: current_width = len(temp_word + char) * font.size * 0.6
-                             if current_width > max_width and temp_word: all_lines.append(temp_word); temp_word = char
-                             else: temp_word += char
-                        current_line = temp_word
-                    else: current_line = word
-            if current_line: all_lines.append(current_line)
-        return all_lines
-
-    @classmethod
-    def INPUT_TYPES(s):
-        return {
-            "required": {
-                "image": ("IMAGE",),
-                "text": ("STRING", {"default": "Your Text Here", "multiline": False}),
-                "font_name": ("STRING", {"default": "arial.ttf"}),
-                "font_size_ratio": ("FLOAT", {"default": 0.05, "min": 0.01, "max": 0.2, "step": 0.005}),
-                "vertical_placement": (["top", "middle", "bottom", "custom"], {"default": "middle"}),
-                "custom_vertical_percentage": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 100.0, "step": 0.1}),
-                "text_color": ("STRING", {"default": "#FFFFFF", "multiline": False}),
-                "vertical_padding_ratio_of_size": ("FLOAT", {"default": 0.7, "min": 0.0, "max": 3.0, "step": 0.05}),
-                "line_spacing": ("INT", {"default": 4, "min": 0, "max": 50, "step": 1}),
-                "bar_color": ("STRING", {"default": "#000000", "multiline": False}),
-                "bar_alpha": ("FLOAT", {"default": 0.5, "min": 0.0, "max": 1.0, "step": 0.01}),
-            },
-        }
-
-    RETURN_TYPES = ("IMAGE",)
-    FUNCTION = "execute"
-    CATEGORY = "ComfySnap"
-
-    def execute(self, image: torch.Tensor, text: str, font_name: str,
-                font_size_ratio: float, vertical_padding_ratio_of_size: float,
-                line_spacing: int, vertical_placement: str,
-                custom_vertical_percentage: float, text_color: str, bar_color: str,
-                bar_alpha: float):
-
-        # Add input validation for image shape
-        if len(image.shape) != 4:
-            raise ValueError("Input image must be a 4D tensor with shape (batch_size, height, width, channels).")
-
-        # Improved font handling
-        font_to_use = None
-        target_font_size = max(1, int(image.shape[2] * font_size_ratio))
-        
-        # Windows font locations
-        system_fonts = os.path.join(os.environ.get('SystemRoot', 'C:\\Windows'), 'Fonts')
-        
-        # Try different font paths based on OS
-        font_paths = [
-            font_name,  # First try the exact path provided
-            os.path.join(system_fonts, font_name),  # Windows system fonts directory
-            os.path.join(os.getcwd(), font_name),  # Current working directory
-            os.path.join(os.path.dirname(os.path.abspath(__file__)), font_name),  # Same directory as this script
-            # Windows fonts
-            os.path.join(system_fonts, 'arial.ttf'),
-            os.path.join(system_fonts, 'calibri.ttf'),
-            os.path.join(system_fonts, 'segoeui.ttf'),
-            # Add any additional fonts or paths here
-        ]
-        
-        # Try each font path
-        for path in font_paths:
-            if os.path.exists(path):
-                try:
-                    font_to_use = ImageFont.truetype(path, target_font_size)
-                    print(f"Using font: {path}")
-                    break
-                except Exception as e:
-                    print(f"Failed to load font {path}: {e}")
-        
-        # If no font was loaded, use PIL's default font
-        if font_to_use is None:
-            try:
-                print("Using PIL's default font")
-                font_to_use = ImageFont.load_default()
-            except Exception as e:
-                print(f"Error loading default font: {e}")
-                # Continue without a font, text may not render correctly
-
-        text = str(text); batch_size, img_height, img_width, channels = image.shape
-        output_images = [];
-
-        bar_rgb = hex_to_rgb(bar_color); text_rgb = hex_to_rgb(text_color)
-        alpha_int = int(bar_alpha * 255); bar_rgba = bar_rgb + (alpha_int,)
-
-        for i in range(batch_size):
-            img_pil_rgb = Image.fromarray((image[i].cpu().numpy() * 255).astype(np.uint8)).convert('RGB')
-            base_img_rgba = img_pil_rgb.convert("RGBA"); temp_draw = ImageDraw.Draw(Image.new("RGB", (1,1)))
-            target_font_size = max(1, int(img_width * font_size_ratio)); font_load_error=False
-
-            if font_to_use is None:
-                 output_images.append(image[i])
-                 continue
-
-            text_height = 0; bar_height = 5; lines = []; padding_x = 0
-            if font_to_use and text:
-                padding_x = int(img_width * 0.025); max_text_width_pixels = img_width - (2 * padding_x)
-                lines = self.wrap_text_pixel_width(temp_draw, text, font_to_use, max_text_width_pixels)
-                if len(lines) <= 1:
-                    text_to_draw = lines[0] if lines else ""
-                    if text_to_draw:
-                        try: bbox = temp_draw.textbbox((0,0), text_to_draw, font=font_to_use, anchor='lt'); text_height = bbox[3] - bbox[1]
-                        except Exception as e: print(f"Error measuring single line: {e}"); text_height = target_font_size
-                    else: text_height = 0
-                else:
-                    wrapped_text = '\n'.join(lines)
-                    try: final_bbox = temp_draw.multiline_textbbox((0, 0), wrapped_text, font=font_to_use, spacing=line_spacing, anchor="lt"); text_height = final_bbox[3] - final_bbox[1]
-                    except Exception as e: text_height = max(1, len(lines)) * target_font_size + max(0, len(lines) - 1) * line_spacing
-                abs_padding_pixels = int(target_font_size * vertical_padding_ratio_of_size); bar_height = max(5, text_height + abs_padding_pixels); bar_height = min(bar_height, img_height)
-
-            y_position = 0
-            if bar_height >= img_height: y_position = 0
-            elif vertical_placement == "top": y_position = 0
-            elif vertical_placement == "middle": y_position = (img_height - bar_height) // 2
-            elif vertical_placement == "bottom": y_position = img_height - bar_height
-            elif vertical_placement == "custom":
-                 percentage_factor = 1.0 - (custom_vertical_percentage / 100.0); y_position = int((img_height - bar_height) * percentage_factor); y_position = max(0, min(y_position, img_height - bar_height))
-            else: y_position = (img_height - bar_height) // 2
-
-            txt_layer = Image.new("RGBA", base_img_rgba.size, (255, 255, 255, 0)); draw_layer = ImageDraw.Draw(txt_layer)
-            if font_to_use and text:
-                if bar_alpha > 0: draw_layer.rectangle([(0, y_position), (img_width, y_position + bar_height)], fill=bar_rgba)
-                center_x = img_width // 2; center_y = y_position + bar_height // 2
-                try:
-                    if len(lines) <= 1:
-                        text_to_draw = lines[0] if lines else "";
-                        if text_to_draw: draw_layer.text((center_x, center_y), text_to_draw, fill=text_rgb, font=font_to_use, anchor="mm")
-                    else:
-                        wrapped_text = '\n'.join(lines); draw_layer.multiline_text((center_x, center_y), wrapped_text, fill=text_rgb, font=font_to_use, spacing=line_spacing, anchor="mm", align="center")
-                except Exception as e: print(f"Error drawing text: {e}")
-
-            combined_img_rgba = Image.alpha_composite(base_img_rgba, txt_layer); final_pil_rgb = combined_img_rgba.convert("RGB")
-            output_img_np = np.array(final_pil_rgb).astype(np.float32) / 255.0; output_images.append(torch.from_numpy(output_img_np))
-
-        if not output_images: return (image,)
-        output_tensor = torch.stack(output_images)
-        return (output_tensor,)
-
-NODE_CLASS_MAPPINGS = { "SnapTextOverlay": SnapTextOverlay }
+# File: snap_text.py
+import torch
+from PIL import Image, ImageDraw, ImageFont
+import os
+import math
+import bisect
+import itertools
+import weakref
+from .base_node import BaseNode, get_logger
+from .utils import hex_to_rgb, expand_per_frame, image_to_tensor, LRUCache, process_in_chunks, CHUNK_IMAGE_INPUTS, result_cached
+from .snap_workers import WORKER_INPUTS, run_sharded
+from .snap_stream import STREAM_INPUTS, STREAM_HIDDEN_INPUTS, stream_session, stream_consumer
+
+# Process-wide cache of loaded fonts keyed by (resolved path, size); None is PIL's default font
+FONT_CACHE = LRUCache(max_entries=32)
+# font_name -> path that loaded successfully, so later calls skip the filesystem probing. Names that fell back to
+# PIL's default font are probed again on every call, so a font installed later is picked up.
+FONT_PATH_CACHE = {}
+_glyph_metrics = weakref.WeakKeyDictionary()
+_glyph_atlases = weakref.WeakKeyDictionary()
+# Wrapped lines and bar height per caption, and rendered overlay sprites keyed by everything that affects their pixels
+LAYOUT_CACHE = LRUCache(max_entries=256)
+SPRITE_CACHE = LRUCache(max_entries=64)
+_log = get_logger("ComfySnap.snap_text")
+
+def font_search_paths(font_name):
+    """Candidate locations for font_name, in the order they are tried."""
+    # Windows font locations
+    system_fonts = os.path.join(os.environ.get('SystemRoot', 'C:\\Windows'), 'Fonts')
+    return [
+        font_name,  # First try the exact path provided
+        os.path.join(system_fonts, font_name),  # Windows system fonts directory
+        os.path.join(os.getcwd(), font_name),  # Current working directory
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), font_name),  # Same directory as this script
+        # Windows fonts
+        os.path.join(system_fonts, 'arial.ttf'),
+        os.path.join(system_fonts, 'calibri.ttf'),
+        os.path.join(system_fonts, 'segoeui.ttf'),
+        # Add any additional fonts or paths here
+    ]
+
+def load_font(font_name, size):
+    """
+    Returns (font, resolved_path) for font_name at size, loading each (path, size) only once per process.
+    Falls back to PIL's default font (path None), and to (None, None) if even that fails.
+    """
+    path = FONT_PATH_CACHE.get(font_name)
+    if path is not None:
+        try: return FONT_CACHE.get_or_create((path, size), lambda: ImageFont.truetype(path, size)), path
+        except Exception as e: _log.warning("font_load_failed", "Failed to load font", path=path, error=str(e)); del FONT_PATH_CACHE[font_name]
+
+    # Try each font path
+    for candidate in font_search_paths(font_name):
+        if os.path.exists(candidate):
+            path = os.path.abspath(candidate)
+            try:
+                font = FONT_CACHE.get_or_create((path, size), lambda: ImageFont.truetype(path, size))
+                _log.info("font_resolved", "Using font", font=font_name, path=path); FONT_PATH_CACHE[font_name] = path
+                return font, path
+            except Exception as e:
+                _log.warning("font_load_failed", "Failed to load font", path=path, error=str(e))
+
+    # If no font was loaded, use PIL's default font
+    try:
+        _log.warning("font_fallback", "Using PIL's default font", font=font_name)
+        return FONT_CACHE.get_or_create((None, 0), ImageFont.load_default), None
+    except Exception as e:
+        _log.error("default_font_failed", "Error loading default font", error=str(e))
+        # Continue without a font, text may not render correctly
+        return None, None
+
+class GlyphMetrics:
+    """
+    Bounded caches of glyph advances, kerning pairs and measured string widths for one font,
+    so repeated layout work does not go back to FreeType.
+    """
+    def __init__(self, font, max_entries=4096):
+        self.font = weakref.proxy(font)  # the registry is keyed weakly by font, so don't keep it alive
+        self.advances = LRUCache(max_entries); self.kerning_pairs = LRUCache(max_entries); self.widths = LRUCache(max_entries)
+        self.runs = LRUCache(max_entries)
+        self._draw = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+
+    def advance(self, char):
+        return self.advances.get_or_create(char, lambda: self.font.getlength(char))
+
+    def kerning(self, left, right):
+        return self.kerning_pairs.get_or_create((left, right), lambda: self.font.getlength(left + right) - self.advance(left) - self.advance(right))
+
+    def line_length(self, text):
+        """Advance width of text, summed from cached glyph advances and kerning pairs."""
+        total = 0.0; previous = None
+        for char in text:
+            total += self.advance(char)
+            if previous is not None: total += self.kerning(previous, char)
+            previous = char
+        return total
+
+    def run_length(self, text):
+        """line_length() memoized per string, for words and other runs that recur across captions."""
+        return self.runs.get_or_create(text, lambda: self.line_length(text))
+
+    def text_width(self, text):
+        """Width of text's bounding box as ImageDraw.textbbox(anchor="lt") reports it, memoized per string."""
+        def measure(): bbox = self._draw.textbbox((0, 0), text, font=self.font, anchor="lt"); return bbox[2] - bbox[0]
+        return self.widths.get_or_create(text, measure)
+
+def last_fitting(count, fits, guess):
+    """
+    Largest m in 0..count for which fits(m) holds, where fits holds up to some m and for none after
+    it (fits(0) is taken as true and never called). Probing gallops outwards from guess, so a close
+    guess settles it in two or three calls.
+    """
+    guess = max(0, min(count, guess))
+    if guess == 0 or fits(guess):
+        low = guess; step = 1
+        while True:
+            if low == count: return low
+            high = min(count, low + step)
+            if not fits(high): break
+            low = high; step *= 2
+    else:
+        high = guess; step = 1
+        while True:
+            low = max(0, high - step)
+            if low == 0 or fits(low): break
+            high = low; step *= 2
+    while high - low > 1:
+        middle = (low + high) // 2
+        if fits(middle): low = middle
+        else: high = middle
+    return low
+
+def glyph_metrics(font):
+    """Returns the shared GlyphMetrics for a loaded font."""
+    metrics = _glyph_metrics.get(font)
+    if metrics is None: metrics = _glyph_metrics[font] = GlyphMetrics(font)
+    return metrics
+
+class GlyphAtlas:
+    """
+    Every distinct glyph of one font rasterized once into an alpha mask positioned relative to
+    its baseline origin. Captions are assembled by blitting masks at advances from GlyphMetrics.
+    """
+    def __init__(self, font, max_glyphs=2048):
+        self.font = weakref.proxy(font); self.metrics = glyph_metrics(font); self.glyphs = LRUCache(max_glyphs)
+        # Pillow's "mm" anchor sits this many rows above the baseline: its integer-rounded (ascender + descender) / 2
+        self.middle_to_baseline = font.getbbox("A", anchor="mm")[1] - font.getbbox("A", anchor="ls")[1]
+        # multiline_text advances by the height of "A" plus the spacing
+        self.line_height = font.getbbox("A")[3]
+
+    def glyph(self, char):
+        """Returns (alpha mask tensor, x offset, y offset from the baseline), or None for blank glyphs."""
+        def rasterize():
+            left, top, right, bottom = self.font.getbbox(char, anchor="ls")
+            if right <= left or bottom <= top: return None
+            mask = Image.new("L", (right - left, bottom - top), 0)
+            ImageDraw.Draw(mask).text((-left, -top), char, font=self.font, fill=255, anchor="ls")
+            return image_to_tensor(mask), left, top
+        return self.glyphs.get_or_create(char, rasterize)
+
+    def render_lines(self, lines, width, center_x, center_y, line_spacing):
+        """
+        Lays lines out like ImageDraw.multiline_text(anchor="mm", align="center") and blits their glyphs.
+        Returns (coverage mask of shape (rows, width), row of the mask's top edge).
+        """
+        # Positions follow Pillow's FreeType renderer exactly: the pen advances in 26.6 fixed point from the
+        # fractional part of the anchor point, every glyph lands on the pen rounded to a whole pixel, and the
+        # "mm" anchor is half the line's advance (rounded) left of the pen start
+        spacing = self.line_height + line_spacing; placements = []
+        line_center = center_y - (len(lines) - 1) * spacing / 2.0
+        for line in lines:
+            x_anchor = (int(round(self.metrics.line_length(line) * 64)) // 2 + 32) >> 6
+            left = math.floor(center_x) - x_anchor; pen = math.floor((center_x - math.floor(center_x)) * 64)
+            y = math.floor(line_center); baseline = y + self.middle_to_baseline + (math.floor((line_center - y) * 64) > 32); previous = None
+            for char in line:
+                if previous is not None: pen += int(round(self.metrics.kerning(previous, char) * 64))
+                glyph = self.glyph(char)
+                if glyph is not None: placements.append((glyph[0], left + ((pen + 32) >> 6) + glyph[1], baseline + glyph[2]))
+                pen += int(round(self.metrics.advance(char) * 64)); previous = char
+            line_center += spacing
+        if not placements: return torch.zeros((0, width)), 0
+        top = min(y for _, _, y in placements); bottom = max(y + mask.shape[0] for mask, _, y in placements)
+        canvas = torch.zeros((bottom - top, width))
+        for mask, x, y in placements:
+            x0 = max(0, x); x1 = min(width, x + mask.shape[1])
+            if x1 <= x0: continue
+            target = canvas[y - top:y - top + mask.shape[0], x0:x1]
+            torch.maximum(target, mask[:, x0 - x:x1 - x], out=target)
+        return canvas, top
+
+def glyph_atlas(font):
+    """Returns the shared GlyphAtlas for a loaded font."""
+    atlas = _glyph_atlases.get(font)
+    if atlas is None: atlas = _glyph_atlases[font] = GlyphAtlas(font)
+    return atlas
+
+def font_cache_stats():
+    """Hit/miss counters of the font, layout and sprite caches and, summed over all live fonts, of the glyph caches."""
+    glyphs = {"hits": 0, "misses": 0, "evictions": 0, "entries": 0, "bytes": 0}; atlas = dict(glyphs)
+    for metrics in list(_glyph_metrics.values()):
+        for cache in (metrics.advances, metrics.kerning_pairs, metrics.widths, metrics.runs):
+            for key, value in cache.stats().items(): glyphs[key] += value
+    for glyph_atlas_ in list(_glyph_atlases.values()):
+        for key, value in glyph_atlas_.glyphs.stats().items(): atlas[key] += value
+    return {"fonts": FONT_CACHE.stats(), "glyphs": glyphs, "atlas": atlas, "layouts": LAYOUT_CACHE.stats(), "sprites": SPRITE_CACHE.stats()}
+
+class SnapTextOverlay(BaseNode):
+    """
+    Applies a basic Snap-style text overlay with a semi-transparent bar.
+    Supports text wrapping and various placement options.
+    """
+
+    @staticmethod
+    def wrap_text_pixel_width(draw, text, font, max_width):
+        """
+        Greedily wraps text into lines whose textbbox width fits max_width; a word too wide for a line
+        of its own is broken between characters.
+
+        Break points are estimated from prefix sums of cached word, space and glyph advances, and only the
+        lines around each estimate are measured exactly (memoized textbbox). That costs a few measurements
+        per line instead of one per word, with the breaks of measuring every growing line, given that a
+        line's width doesn't shrink when text is appended to it.
+        """
+        lines = []
+        if not text or max_width <= 0 or not hasattr(font, 'size'): return lines
+        metrics = glyph_metrics(font); fallback_width = font.size * 0.6
+
+        def width(line):
+            try: return metrics.text_width(line)
+            except Exception: return len(line) * fallback_width
+
+        def advance(run):
+            try: return metrics.run_length(run)
+            except Exception: return len(run) * fallback_width
+
+        space = advance(" ")
+        for paragraph in text.split('\n'):
+            if not paragraph.strip(): lines.append(""); continue
+            words = [word.strip() for word in paragraph.split(' ')]; words = [word for word in words if word]
+            # ends[j]: advance of words[:j], each followed by a space
+            ends = list(itertools.accumulate((advance(word) + space for word in words), initial=0.0))
+            current = ""; k = 0
+            while k < len(words):
+                prefix = current + " " if current else ""
+                budget = ends[k] + max_width - advance(prefix) + space
+                guess = bisect.bisect_right(ends, budget, k, len(ends)) - 1 - k
+                count = last_fitting(len(words) - k, lambda m: width(prefix + " ".join(words[k:k + m])) <= max_width, guess)
+                if count: current = prefix + " ".join(words[k:k + count]); k += count
+                if k == len(words): break
+                # words[k] doesn't fit after the current line
+                word = words[k]; k += 1
+                if current: lines.append(current)
+                if width(word) <= max_width: current = word; continue
+                offsets = list(itertools.accumulate((advance(char) for char in word), initial=0.0)); start = 0
+                while True:
+                    guess = bisect.bisect_right(offsets, offsets[start] + max_width, start, len(offsets)) - 1 - start
+                    count = max(1, last_fitting(len(word) - start, lambda m: width(word[start:start + m]) <= max_width, guess))
+                    if start + count == len(word): current = word[start:]; break
+                    lines.append(word[start:start + count]); start += count
+            if current: lines.append(current)
+        return lines
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "image": ("IMAGE",),
+                "text": ("STRING", {"default": "Your Text Here", "multiline": True}),
+                "font_name": ("STRING", {"default": "arial.ttf"}),
+                "font_size_ratio": ("FLOAT", {"default": 0.05, "min": 0.01, "max": 0.2, "step": 0.005}),
+                "vertical_placement": (["top", "middle", "bottom", "custom"], {"default": "middle"}),
+                "custom_vertical_percentage": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 100.0, "step": 0.1}),
+                "text_color": ("STRING", {"default": "#FFFFFF", "multiline": False}),
+                "vertical_padding_ratio_of_size": ("FLOAT", {"default": 0.7, "min": 0.0, "max": 3.0, "step": 0.05}),
+                "line_spacing": ("INT", {"default": 4, "min": 0, "max": 50, "step": 1}),
+                "bar_color": ("STRING", {"default": "#000000", "multiline": False}),
+                "bar_alpha": ("FLOAT", {"default": 0.5, "min": 0.0, "max": 1.0, "step": 0.01}),
+            },
+            "optional": {
+                "per_frame_text": ("BOOLEAN", {"default": False}),
+                "per_frame_positions": ("STRING", {"default": "", "multiline": False}),
+                **WORKER_INPUTS,
+                **STREAM_INPUTS,
+                **CHUNK_IMAGE_INPUTS,
+                "use_result_cache": ("BOOLEAN", {"default": False}),
+            },
+            "hidden": {**STREAM_HIDDEN_INPUTS},
+        }
+
+    RETURN_TYPES = ("IMAGE",)
+    FUNCTION = "execute"
+    CATEGORY = "ComfySnap"
+
+    @result_cached
+    def execute(self, image: torch.Tensor, text: str, font_name: str,
+                font_size_ratio: float, vertical_padding_ratio_of_size: float,
+                line_spacing: int, vertical_placement: str,
+                custom_vertical_percentage: float, text_color: str, bar_color: str,
+                bar_alpha: float, per_frame_text: bool = False, per_frame_positions: str = "",
+                chunk_size: int = 0, max_memory_mb: int = 0, mmap_dir: str = "", process_workers: int = 0,
+                stream_id: str = "", stream_reset: bool = False, unique_id: str = None):
+
+        # Add input validation for image shape
+        if len(image.shape) != 4:
+            raise ValueError("Input image must be a 4D tensor with shape (batch_size, height, width, channels).")
+        if image.shape[0] == 0: return (image,)
+
+        # Captions, positions and the renderer are fixed for the whole batch so every chunk draws the same way.
+        # In a stream, per-frame captions continue from the stream's position, the renderer stays the one the
+        # first batch picked and sprites are kept in the stream's own cache.
+        batch_size = image.shape[0]
+        session = stream_session(stream_id, stream_reset)
+        consumer = stream_consumer(self, unique_id)
+        first_frame = session.claim(consumer, batch_size) if session is not None else 0
+        frame_texts, frame_percentages = self.frame_captions(text, per_frame_text, per_frame_positions,
+                                                             custom_vertical_percentage, batch_size, first_frame)
+        renderer = self.pick_renderer(frame_texts)
+        if session is not None: renderer = session.state(consumer).setdefault("renderer", renderer)
+        sprite_cache = session.sprites if session is not None else SPRITE_CACHE
+        drawn = True
+        # With process_workers > 1 (and a CPU batch) frames are rasterized and composited on the process pool of
+        # snap_workers. The font is resolved here first, so every worker loads the same file.
+        sharded = process_workers > 1 and image.device.type == "cpu" and batch_size > 1
+        if sharded:
+            font, font_path = load_font(font_name, max(1, int(image.shape[2] * font_size_ratio)))
+            if font is None: return (image,)
+
+        def process(start, end, out):
+            nonlocal drawn
+            with self.stage("conversion", 4 * (end - start) * image.shape[1] * image.shape[2] * 3):
+                target = image[start:end, ..., :3].to(torch.float32, copy=True) if out is None else out.copy_(image[start:end, ..., :3])
+            if sharded:
+                with self.stage("workers", 4 * target.numel()):
+                    run_sharded(target, self.overlay_shard, (frame_texts[start:end], frame_percentages[start:end], font_path or font_name,
+                                font_size_ratio, vertical_padding_ratio_of_size, line_spacing, vertical_placement, text_color,
+                                bar_color, bar_alpha, renderer), process_workers)
+                return target
+            drawn = self.overlay_into(target, frame_texts[start:end], font_name, font_size_ratio, vertical_padding_ratio_of_size,
+                                      line_spacing, vertical_placement, frame_percentages[start:end], text_color, bar_color,
+                                      bar_alpha, renderer=renderer, sprite_cache=sprite_cache) and drawn
+            return target
+
+        output_tensor = process_in_chunks(batch_size, image.shape[1:3] + (3,), image.device, process,
+                                          chunk_size, max_memory_mb, mmap_dir)
+        if not drawn: return (image,)
+        return (output_tensor,)
+
+    @staticmethod
+    def frame_captions(text, per_frame_text, per_frame_positions, custom_vertical_percentage, batch_size, first_frame=0):
+        """Expands the caption and position inputs to one (text, percentage) per frame, starting at frame first_frame of the sequence."""
+        # Captions and positions may vary per frame: a list, or one line of text per frame
+        if isinstance(text, (list, tuple)): frame_texts = [str(t) for t in text]
+        elif per_frame_text: frame_texts = str(text).split('\n')
+        else: frame_texts = [str(text)]
+        frame_texts = expand_per_frame(frame_texts, batch_size, offset=first_frame)
+        positions = per_frame_positions if isinstance(per_frame_positions, str) and per_frame_positions.strip() else custom_vertical_percentage
+        return frame_texts, expand_per_frame(positions, batch_size, float, offset=first_frame)
+
+    @staticmethod
+    def overlay_shard(frames, frame_offset, frame_texts, frame_percentages, font_name, font_size_ratio, vertical_padding_ratio_of_size,
+                      line_spacing, vertical_placement, text_color, bar_color, bar_alpha, renderer):
+        """overlay_into() for the frames of a batch starting at frame_offset, given the whole batch's captions and positions."""
+        end = frame_offset + frames.shape[0]
+        SnapTextOverlay().overlay_into(frames, frame_texts[frame_offset:end], font_name, font_size_ratio, vertical_padding_ratio_of_size,
+                                       line_spacing, vertical_placement, frame_percentages[frame_offset:end], text_color, bar_color,
+                                       bar_alpha, renderer=renderer)
+        return frames
+
+    @staticmethod
+    def pick_renderer(frame_texts, font=None):
+        """
+        A single caption goes through PIL's own text renderer; varying captions use the glyph atlas.
+        The atlas needs FreeType metrics, so bitmap fonts (PIL's default font without FreeType) always use PIL.
+        """
+        if font is not None and not isinstance(font, ImageFont.FreeTypeFont): return "pil"
+        return "pil" if len(set(frame_texts)) == 1 else "atlas"
+
+    def overlay_into(self, output_tensor: torch.Tensor, text, font_name: str,
+                     font_size_ratio: float, vertical_padding_ratio_of_size: float,
+                     line_spacing: int, vertical_placement: str,
+                     custom_vertical_percentage, text_color: str, bar_color: str,
+                     bar_alpha: float, per_frame_text: bool = False, per_frame_positions: str = "",
+                     renderer: str = None, sprite_cache: LRUCache = None, stage_timer=None):
+        """
+        Draws the overlay in place into a (B, H, W, 3) float tensor.
+        Returns False, leaving the tensor untouched, when no font could be loaded.
+        renderer ("pil" or "atlas") defaults to pick_renderer() over this tensor's captions and is "pil" for bitmap fonts;
+        sprites are memoized in sprite_cache (SPRITE_CACHE by default). The layout, rasterize and composite stages
+        are timed with stage_timer, this node's stage() by default, so a calling node can record them as its own.
+        """
+        # Fonts are resolved and loaded once per (path, size) for the whole process
+        target_font_size = max(1, int(output_tensor.shape[2] * font_size_ratio))
+        font_to_use, font_path = load_font(font_name, target_font_size)
+
+        batch_size, img_height, img_width, channels = output_tensor.shape
+        if font_to_use is None: return False
+
+        bar_rgb = hex_to_rgb(bar_color); text_rgb = hex_to_rgb(text_color)
+        alpha_int = int(bar_alpha * 255); bar_rgba = bar_rgb + (alpha_int,)
+
+        frame_texts, frame_percentages = self.frame_captions(text, per_frame_text, per_frame_positions,
+                                                             custom_vertical_percentage, batch_size)
+
+        # Every distinct caption is laid out and rasterized once into a bar-sized sprite (memoized across calls),
+        # then blended into the bar rows of all frames that show it. Varying captions are assembled from a glyph
+        # atlas so each glyph is rasterized only once.
+        if renderer is None or not isinstance(font_to_use, ImageFont.FreeTypeFont): renderer = self.pick_renderer(frame_texts, font_to_use)
+        if sprite_cache is None: sprite_cache = SPRITE_CACHE
+        if stage_timer is None: stage_timer = self.stage
+        layout_args = (target_font_size, vertical_padding_ratio_of_size, line_spacing)
+        # Sprites are cached on the output's device, so frames never leave it and each sprite is uploaded once
+        device = output_tensor.device
+        groups = {}
+        for i, key in enumerate(zip(frame_texts, frame_percentages)): groups.setdefault(key, []).append(i)
+
+        render = self.render_sprite if renderer == "pil" else self.render_atlas_sprite
+
+        def layout(frame_text):
+            with stage_timer("layout"): return self.layout_text(font_to_use, frame_text, img_width, img_height, *layout_args)
+
+        def rasterize(frame_text, lines, bar_height):
+            with stage_timer("rasterize") as stage:
+                sprite = self.sprite_to(render(font_to_use, frame_text, lines, img_width, bar_height, line_spacing, text_rgb, bar_rgba, bar_alpha), device)
+                if sprite is not None: stage.nbytes = sprite[1].element_size() * sprite[1].numel()
+            return sprite
+
+        for (frame_text, percentage), frames in groups.items():
+            lines, bar_height = LAYOUT_CACHE.get_or_create((font_path, frame_text, img_width, img_height) + layout_args, lambda: layout(frame_text))
+            sprite = sprite_cache.get_or_create((renderer, font_path, frame_text, img_width, bar_height) + layout_args + (text_rgb, bar_rgba, device),
+                lambda: rasterize(frame_text, lines, bar_height))
+            if sprite is None: continue
+            y_position = self.bar_y_position(bar_height, img_height, vertical_placement, percentage)
+            with stage_timer("composite"):
+                self.composite_sprite(output_tensor, y_position + sprite[0], sprite[1], None if len(frames) == batch_size else frames)
+        return True
+
+    def layout_text(self, font, text, img_width, img_height, target_font_size, vertical_padding_ratio_of_size, line_spacing):
+        """Wraps text to the frame width and sizes the bar around it; returns (lines, bar_height)."""
+        temp_draw = ImageDraw.Draw(Image.new("RGB", (1,1)))
+        text_height = 0; bar_height = 5; lines = []; padding_x = 0
+        if font and text:
+            padding_x = int(img_width * 0.025); max_text_width_pixels = img_width - (2 * padding_x)
+            lines = self.wrap_text_pixel_width(temp_draw, text, font, max_text_width_pixels)
+            if len(lines) <= 1:
+                text_to_draw = lines[0] if lines else ""
+                if text_to_draw:
+                    try: bbox = temp_draw.textbbox((0,0), text_to_draw, font=font, anchor='lt'); text_height = bbox[3] - bbox[1]
+                    except Exception as e: _log.warning("measure_failed", "Error measuring single line", error=str(e)); text_height = target_font_size
+                else: text_height = 0
+            else:
+                wrapped_text = '\n'.join(lines)
+                try: final_bbox = temp_draw.multiline_textbbox((0, 0), wrapped_text, font=font, spacing=line_spacing, anchor="lt"); text_height = final_bbox[3] - final_bbox[1]
+                except Exception as e: text_height = max(1, len(lines)) * target_font_size + max(0, len(lines) - 1) * line_spacing
+            abs_padding_pixels = int(target_font_size * vertical_padding_ratio_of_size); bar_height = max(5, text_height + abs_padding_pixels); bar_height = min(bar_height, img_height)
+        return lines, bar_height
+
+    @staticmethod
+    def bar_y_position(bar_height, img_height, vertical_placement, custom_vertical_percentage):
+        """Top row of the bar for a placement; custom percentages use 0 = bottom edge, 100 = top edge."""
+        y_position = 0
+        if bar_height >= img_height: y_position = 0
+        elif vertical_placement == "top": y_position = 0
+        elif vertical_placement == "middle": y_position = (img_height - bar_height) // 2
+        elif vertical_placement == "bottom": y_position = img_height - bar_height
+        elif vertical_placement == "custom":
+             percentage_factor = 1.0 - (custom_vertical_percentage / 100.0); y_position = int((img_height - bar_height) * percentage_factor); y_position = max(0, min(y_position, img_height - bar_height))
+        else: y_position = (img_height - bar_height) // 2
+        return y_position
+
+    @staticmethod
+    def render_sprite(font, text, lines, img_width, bar_height, line_spacing, text_rgb, bar_rgba, bar_alpha):
+        """
+        Rasterizes the bar and text with PIL into an RGBA layer spanning only the rows they touch.
+        Returns (top row relative to the bar's top, float RGBA tensor (rows, width, 4)), or None if nothing is drawn.
+        """
+        if not (font and text): return None
+        center_x = img_width // 2; center_y = bar_height // 2
+        wrapped_text = '\n'.join(lines); rows = []
+        if bar_alpha > 0: rows += [0, bar_height + 1]
+        if wrapped_text:
+            temp_draw = ImageDraw.Draw(Image.new("RGB", (1,1)))
+            try:
+                if len(lines) <= 1: ink = temp_draw.textbbox((center_x, center_y), wrapped_text, font=font, anchor="mm")
+                else: ink = temp_draw.multiline_textbbox((center_x, center_y), wrapped_text, font=font, spacing=line_spacing, anchor="mm", align="center")
+                rows += [int(ink[1]) - 2, int(ink[3]) + 3]  # small margin for antialiased edges
+            except Exception: rows += [0, bar_height + 1]
+        if not rows: return None
+        top = min(rows); bottom = max(rows)
+
+        txt_layer = Image.new("RGBA", (img_width, bottom - top), (255, 255, 255, 0)); draw_layer = ImageDraw.Draw(txt_layer)
+        if bar_alpha > 0: draw_layer.rectangle([(0, -top), (img_width, bar_height - top)], fill=bar_rgba)
+        try:
+            if len(lines) <= 1:
+                if wrapped_text: draw_layer.text((center_x, center_y - top), wrapped_text, fill=text_rgb, font=font, anchor="mm")
+            else:
+                draw_layer.multiline_text((center_x, center_y - top), wrapped_text, fill=text_rgb, font=font, spacing=line_spacing, anchor="mm", align="center")
+        except Exception as e: _log.warning("draw_failed", "Error drawing text", error=str(e))
+        return top, image_to_tensor(txt_layer)
+
+    @staticmethod
+    def render_atlas_sprite(font, text, lines, img_width, bar_height, line_spacing, text_rgb, bar_rgba, bar_alpha):
+        """Same contract as render_sprite, but the text is blitted from the font's GlyphAtlas."""
+        if not (font and text): return None
+        text_mask, text_top = glyph_atlas(font).render_lines(lines, img_width, img_width // 2, bar_height // 2, line_spacing)
+        rows = [text_top, text_top + text_mask.shape[0]] if text_mask.shape[0] else []
+        if bar_alpha > 0: rows += [0, bar_height + 1]
+        if not rows: return None
+        top = min(rows); bottom = max(rows)
+
+        # Same 8-bit blending PIL applies when drawing onto the transparent layer: the bar replaces the layer's
+        # pixels, then the text color is mixed in by glyph coverage with PIL's rounded division by 255. Where the
+        # layer is still fully transparent, any coverage takes the text color outright and only alpha is mixed.
+        sprite = torch.zeros((bottom - top, img_width, 4), dtype=torch.int32); sprite[..., :3] = 255
+        if bar_alpha > 0: sprite[-top:bar_height + 1 - top] = torch.tensor(bar_rgba, dtype=torch.int32)
+        if text_mask.shape[0]:
+            coverage = text_mask.mul(255.0).round_().to(torch.int32).unsqueeze(-1)
+            region = sprite[text_top - top:text_top - top + text_mask.shape[0]]
+            color_mask = torch.where(region[..., 3:] > 0, coverage, (coverage > 0).to(torch.int32) * 255)
+            mask = torch.cat((color_mask.expand(-1, -1, 3), coverage), dim=-1)
+            blended = region * (255 - mask) + torch.tensor(text_rgb + (255,), dtype=torch.int32) * mask + 128
+            region.copy_((blended + (blended >> 8)) >> 8)
+        return top, sprite.to(torch.float32).div_(255.0)
+
+    @staticmethod
+    def sprite_to(sprite, device):
+        """Moves a (top, RGBA tensor) sprite to device; None passes through."""
+        return sprite if sprite is None else (sprite[0], sprite[1].to(device))
+
+    @staticmethod
+    def composite_sprite(output_tensor, top, sprite, frames=None):
+        """
+        Alpha-blends an RGBA sprite in place into rows top.. of a (B, H, W, 3) tensor,
+        clipped to the frame, for every frame or only the given frame indices.
+        """
+        start = max(0, top); end = min(output_tensor.shape[1], top + sprite.shape[0])
+        if end <= start: return
+        sprite = sprite[start - top:end - top].to(output_tensor.device); alpha = sprite[..., 3:]
+        if frames is None:
+            rows = output_tensor[:, start:end]
+            rows.mul_(1.0 - alpha).add_(sprite[..., :3] * alpha)
+        else:
+            index = torch.tensor(frames, dtype=torch.long, device=output_tensor.device)
+            rows = output_tensor[index, start:end]
+            output_tensor[index, start:end] = rows.mul_(1.0 - alpha).add_(sprite[..., :3] * alpha)
+
+NODE_CLASS_MAPPINGS = { "SnapTextOverlay": SnapTextOverlay }
 NODE_DISPLAY_NAME_MAPPINGS = { "SnapTextOverlay": "Snap Text" }
\ No newline at end of file
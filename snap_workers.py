@@ -0,0 +1,151 @@
+# File: snap_workers.py
+# A persistent process pool that shards the per-frame work of large batches across CPU cores
+import os
+import sys
+import threading
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+import torch
+from .base_node import get_logger
+
+# Optional node input selecting the number of worker processes (0 or 1 = run in this process)
+WORKER_INPUTS = {
+    "process_workers": ("INT", {"default": 0, "min": 0, "max": 256}),
+}
+_log = get_logger("ComfySnap.snap_workers")
+_pool = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+_main_lock = threading.Lock()
+
+# Run by every worker before its first task. Workers are fresh interpreters ("spawn", which is safe once CUDA
+# is initialized), and ComfyUI may register this package under a name that isn't importable from sys.path,
+# so the package is registered by location; its submodules then import normally, without running __init__.py.
+_BOOTSTRAP = """
+import importlib, importlib.util, sys
+spec = importlib.util.spec_from_file_location({package!r}, {init!r}, submodule_search_locations=[{directory!r}])
+sys.modules.setdefault({package!r}, importlib.util.module_from_spec(spec))
+importlib.import_module({package!r} + ".snap_workers").init_worker()
+"""
+
+
+def init_worker():
+    """Worker setup: the pool provides the parallelism, so each worker runs torch single-threaded."""
+    torch.set_num_threads(1)
+
+
+def get_pool(workers):
+    """
+    Returns the process-wide pool, started on first use and kept for later prompts. The pool
+    only grows: a request for more workers than it has starts a larger one. The old pool is not
+    shut down, as other callers may still be submitting to it; it finishes the work it was given
+    and stops its workers once nothing holds it any more.
+    """
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or _pool_size < workers:
+            directory = os.path.dirname(os.path.abspath(__file__))
+            bootstrap = _BOOTSTRAP.format(package=__package__, init=os.path.join(directory, "__init__.py"), directory=directory)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=exec, initargs=(bootstrap,))
+            _pool_size = workers
+        return _pool
+
+
+def shutdown_pool():
+    """Stops the worker processes; the next sharded call starts a new pool."""
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is not None: _pool.shutdown(wait=True)
+        _pool = None; _pool_size = 0
+
+
+@contextlib.contextmanager
+def _hidden_main():
+    # Spawned workers re-import the parent's __main__ from its __spec__ or __file__. Under ComfyUI that is main.py,
+    # whose top level loads all of ComfyUI, so workers (started on demand inside submit()) are started while
+    # __main__ looks like an interactive session. The lock keeps concurrent callers from restoring each other's values.
+    main = sys.modules.get("__main__")
+    with _main_lock:
+        if main is None:
+            yield; return
+        spec = getattr(main, "__spec__", None); path = main.__dict__.pop("__file__", None)
+        main.__spec__ = None
+        try: yield
+        finally:
+            main.__spec__ = spec
+            if path is not None: main.__file__ = path
+
+
+def _discard_pool(pool):
+    # A pool with a dead worker can't run tasks any more; the next sharded call starts a new one, unless another
+    # caller already replaced it
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is pool: _pool = None; _pool_size = 0
+
+
+def shard_bounds(batch_size, shards):
+    """Splits range(batch_size) into shards contiguous (start, end) ranges of near-equal size."""
+    shards = max(1, min(shards, batch_size))
+    return [(batch_size * i // shards, batch_size * (i + 1) // shards) for i in range(shards)]
+
+
+def _run_shard(shard_fn, name, shape, start, end, frame_offset, args):
+    # Runs in a worker: attaches to the parent's shared block and processes frames start..end in place
+    block = shared_memory.SharedMemory(name=name); frames = None
+    try:
+        frames = torch.frombuffer(block.buf, dtype=torch.float32).view(shape)[start:end]
+        shard_fn(frames, frame_offset + start, *args)
+    finally:
+        frames = None  # the tensor holds an export of the buffer, which must be released before close()
+        block.close()
+
+
+def run_sharded(frames, shard_fn, args=(), workers=0, frame_offset=0):
+    """
+    Calls shard_fn(frames[a:b], frame_offset + a, *args) over contiguous shards of a (B, ...) float32
+    batch, modifying it in place. shard_fn must be a module-level function or a static method (workers
+    import it by name), and each frame's result must depend only on the frame and its index.
+
+    With workers > 1 and a CPU batch of at least two frames the shards run on the process pool. The
+    frames reach the workers through one shared-memory block instead of being pickled. Otherwise, or
+    when the pool can't be started, a worker dies or the shards can't be sent to it, shard_fn runs over
+    the whole batch in this process, with the same result.
+
+    Returns:
+        int: The number of worker processes used (0 for in-process execution).
+    """
+    bounds = shard_bounds(frames.shape[0], workers)
+    if workers <= 1 or len(bounds) < 2 or frames.device.type != "cpu" or frames.dtype != torch.float32:
+        shard_fn(frames, frame_offset, *args); return 0
+    try:
+        block = shared_memory.SharedMemory(create=True, size=frames.numel() * frames.element_size())
+    except OSError as e:
+        _log.warning("shared_memory_failed", "Running in-process; shared memory is unavailable", error=str(e))
+        shard_fn(frames, frame_offset, *args); return 0
+    shared = None
+    try:
+        shared = torch.frombuffer(block.buf, dtype=torch.float32).view(frames.shape)
+        shared.copy_(frames)
+        pool = None; futures = []
+        try:
+            pool = get_pool(workers)
+            with _hidden_main():
+                futures = [pool.submit(_run_shard, shard_fn, block.name, tuple(frames.shape), start, end, frame_offset, args) for start, end in bounds]
+            for future in futures: future.result()
+        except Exception as e:
+            # Whatever failed (a dead worker, arguments that don't pickle, a shard raising), the input frames are
+            # untouched, so the batch is simply processed here instead; an error of shard_fn itself surfaces again
+            for future in futures: future.cancel()
+            _log.warning("worker_pool_failed", "Running in-process; the worker pool failed", error=f"{type(e).__name__}: {e}")
+            if isinstance(e, BrokenProcessPool): _discard_pool(pool)
+            shard_fn(frames, frame_offset, *args); return 0
+        frames.copy_(shared)
+        return len(bounds)
+    finally:
+        shared = None  # release the tensor's export of the buffer before closing it
+        block.close(); block.unlink()
@@ -1,5 +1,21 @@
 # File: utils.py
 # Common utility functions for ComfySnap nodes
+import os
+import atexit
+import functools
+import hashlib
+import inspect
+import tempfile
+import threading
+import warnings
+import weakref
+from collections import OrderedDict
+import numpy as np
+import torch
+from PIL import Image
+from .base_node import get_logger
+
+_log = get_logger("ComfySnap.utils")
 
 def hex_to_rgb(hex_color):
     """
@@ -22,4 +38,432 @@ def hex_to_rgb(hex_color):
         return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
     
     # Default fallback to white if the format is invalid
-    return (255, 255, 255)
\ No newline at end of file
+    return (255, 255, 255)
+
+def derive_frame_seed(seed, frame_index):
+    """
+    Derives an independent 64-bit seed for one frame from a node seed (SplitMix64).
+    
+    Because each frame's seed depends only on (seed, frame_index), per-frame random
+    draws stay the same no matter how the frames are batched.
+    
+    Args:
+        seed (int): The node's seed.
+        frame_index (int): Index of the frame within the sequence.
+        
+    Returns:
+        int: A seed in the range 0 to 2**64 - 1.
+    """
+    mask = 0xFFFFFFFFFFFFFFFF
+    z = (seed + (frame_index + 1) * 0x9E3779B97F4A7C15) & mask
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & mask
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & mask
+    return z ^ (z >> 31)
+
+class LRUCache:
+    """
+    A thread-safe least-recently-used cache with hit/miss/eviction counters.
+    
+    Args:
+        max_entries (int): Number of entries kept before the least recently used one is evicted.
+        max_bytes (int): Optional bound on the summed sizeof() of the entries; 0 means unbounded.
+        sizeof (callable, optional): Size of a value in bytes, required for max_bytes.
+    """
+    def __init__(self, max_entries=128, max_bytes=0, sizeof=None):
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(0, int(max_bytes))
+        self.sizeof = sizeof
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+
+    def get(self, key, default=None):
+        """Returns the cached value for key (marking it recently used), or default on a miss."""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """Stores value under key, evicting the oldest entries past max_entries or max_bytes."""
+        with self._lock:
+            size = self.sizeof(value) if self.sizeof is not None else 0
+            if key in self._data:
+                self.bytes -= self._sizes.pop(key, 0)
+                del self._data[key]
+            if self.max_bytes and size > self.max_bytes:
+                # Would evict everything else and still not fit
+                return
+            self._data[key] = value
+            self._sizes[key] = size
+            self.bytes += size
+            while len(self._data) > self.max_entries or (self.max_bytes and self.bytes > self.max_bytes):
+                old_key, _ = self._data.popitem(last=False)
+                self.bytes -= self._sizes.pop(old_key, 0)
+                self.evictions += 1
+
+    def get_or_create(self, key, factory):
+        """Returns the cached value for key, calling factory() and caching its result on a miss."""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            value = factory()
+            self.put(key, value)
+            return value
+
+    def pop(self, key, default=None):
+        """Removes key and returns its value, or default when it isn't cached."""
+        with self._lock:
+            if key not in self._data: return default
+            self.bytes -= self._sizes.pop(key, 0)
+            return self._data.pop(key)
+
+    def clear(self):
+        """Drops every entry; the counters are kept."""
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """
+        Returns the cache counters.
+        
+        Returns:
+            dict: hits, misses, evictions, the current number of entries and their size in bytes.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": len(self._data),
+                    "bytes": self.bytes}
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+def expand_per_frame(values, batch_size, cast=None, offset=0):
+    """
+    Spreads per-frame values over a batch, repeating them cyclically when fewer values than frames are given.
+    
+    Args:
+        values: A scalar, a list/tuple, a tensor or array, or (when cast is given) a comma- or
+            newline-separated string.
+        batch_size (int): Number of frames.
+        cast (callable, optional): Conversion applied to every value, e.g. float.
+        offset (int): Index of the batch's first frame in a longer sequence (see snap_stream).
+        
+    Returns:
+        list: Exactly batch_size values.
+    """
+    if isinstance(values, str) and cast is not None:
+        values = [v for v in values.replace("\n", ",").split(",") if v.strip()]
+    elif hasattr(values, "tolist"):
+        values = values.tolist()
+    if not isinstance(values, (list, tuple)):
+        values = [values]
+    if not values:
+        raise ValueError("Expected at least one per-frame value.")
+    if cast is not None:
+        values = [cast(v) for v in values]
+    return [values[(offset + i) % len(values)] for i in range(batch_size)]
+
+# Crossings of the tensor/PIL boundary, counted once per batch transfer rather than per frame:
+# "to_pil" for quantize_batch(), "from_pil" for upload_batch() and image_to_tensor().
+# Tensor-only paths never touch them, which makes device residency checkable on a CPU-only machine.
+_transfer_counts = {"to_pil": 0, "from_pil": 0}
+_transfer_lock = threading.Lock()
+
+def _count_transfer(direction):
+    with _transfer_lock:
+        _transfer_counts[direction] += 1
+
+def pil_transfer_stats(reset=False):
+    """
+    Returns how many batches crossed the tensor/PIL boundary in each direction.
+    
+    Args:
+        reset (bool): Zero the counters after reading them.
+        
+    Returns:
+        dict: {"to_pil": int, "from_pil": int}
+    """
+    with _transfer_lock:
+        stats = dict(_transfer_counts)
+        if reset:
+            _transfer_counts.update(to_pil=0, from_pil=0)
+    return stats
+
+def quantize_batch(image, out=None):
+    """
+    Quantizes a whole (B, H, W, C) 0-1 image batch to 8 bits in one pass.
+    
+    The result is an RGBX buffer (4 bytes per pixel, the pad byte set to 255), which is the
+    layout Pillow uses internally, so pil_view() can wrap each frame without copying.
+    
+    Args:
+        image (torch.Tensor): Image batch on any device; only the first 3 channels are used.
+        out (np.ndarray, optional): Preallocated (B, H, W, 4) uint8 buffer to fill.
+        
+    Returns:
+        np.ndarray: The (B, H, W, 4) uint8 buffer.
+    """
+    batch_size, height, width = image.shape[:3]
+    if out is None:
+        out = np.empty((batch_size, height, width, 4), dtype=np.uint8)
+    out[..., 3] = 255
+    # Truncates like the (x * 255).astype(np.uint8) conversion the nodes used per frame
+    torch.from_numpy(out)[..., :3].copy_(image[..., :3].clamp(0.0, 1.0).mul(255.0))
+    _count_transfer("to_pil")
+    return out
+
+def upload_batch(frames_u8, output):
+    """
+    Copies a whole (B, H, W, 3 or 4) uint8 host buffer into a float32 batch as 0-1 values in one transfer.
+    
+    Frames decoded by Pillow are written into the host buffer first (see quantize_batch()), so an
+    output on another device receives a single host-to-device copy instead of one per frame.
+    
+    Args:
+        frames_u8 (np.ndarray): Host buffer; only the first 3 channels are used.
+        output (torch.Tensor): (B, H, W, 3) float32 output on any device.
+        
+    Returns:
+        torch.Tensor: output
+    """
+    output.copy_(torch.from_numpy(frames_u8)[..., :3]).div_(255.0)
+    _count_transfer("from_pil")
+    return output
+
+def pil_view(frames_u8, index):
+    """
+    Returns a read-only PIL image sharing memory with one frame of a quantize_batch() buffer.
+    
+    Args:
+        frames_u8 (np.ndarray): (B, H, W, 4) uint8 buffer.
+        index (int): Frame index.
+        
+    Returns:
+        PIL.Image.Image: An RGBX image over the frame's bytes (JPEG and RGB consumers treat it as RGB).
+    """
+    height, width = frames_u8.shape[1:3]
+    return Image.frombuffer("RGBX", (width, height), frames_u8[index], "raw", "RGBX", 0, 1)
+
+def _readonly_tensor(array):
+    # Pillow exposes its pixels as a read-only array; the tensor is only ever copied from, so sharing it is safe
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        return torch.from_numpy(array)
+
+def image_to_tensor(pil_image):
+    """
+    Converts a single PIL image to a float32 tensor of 0-1 values with shape (H, W, channels).
+    
+    Args:
+        pil_image (PIL.Image.Image): Image in any mode numpy can represent (e.g. RGB, RGBA, L).
+        
+    Returns:
+        torch.Tensor: The image on the CPU.
+    """
+    _count_transfer("from_pil")
+    return _readonly_tensor(np.asarray(pil_image)).to(torch.float32).div_(255.0)
+
+# Optional inputs shared by every node that supports chunked execution
+CHUNK_INPUTS = {
+    "chunk_size": ("INT", {"default": 0, "min": 0, "max": 4096}),
+    "max_memory_mb": ("INT", {"default": 0, "min": 0, "max": 1048576}),
+}
+# Adds a memory-mapped output option for nodes that return an image batch
+CHUNK_IMAGE_INPUTS = dict(CHUNK_INPUTS, mmap_dir=("STRING", {"default": "", "multiline": False}))
+
+def resolve_chunk_size(batch_size, frame_bytes, chunk_size=0, max_memory_mb=0, work_factor=4):
+    """
+    Picks how many frames to process at once.
+    
+    Args:
+        batch_size (int): Number of frames in the batch.
+        frame_bytes (int): Size of one float32 frame in bytes.
+        chunk_size (int): Explicit chunk size; 0 lets max_memory_mb decide.
+        max_memory_mb (int): Working-memory budget per chunk; 0 means unlimited.
+        work_factor (int): Frame-sized temporaries the processing allocates per frame.
+        
+    Returns:
+        int: A chunk size between 1 and batch_size (the whole batch when neither limit is set).
+    """
+    if chunk_size > 0:
+        return max(1, min(batch_size, chunk_size))
+    if max_memory_mb > 0:
+        return max(1, min(batch_size, (max_memory_mb * 1024 * 1024) // max(1, frame_bytes * work_factor)))
+    return max(1, batch_size)
+
+# Backing files whose removal failed while they were still mapped (Windows), retried by the next
+# allocate_output() call and at exit
+_PENDING_REMOVALS = set()
+_pending_lock = threading.Lock()
+
+def _remove_backing_file(path, retry=True):
+    """
+    Deletes a memory-mapped output's backing file. A failed attempt is queued for one retry when
+    retry is set and logged otherwise.
+    """
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except OSError as error:
+        if retry:
+            with _pending_lock: _PENDING_REMOVALS.add(path)
+        else:
+            _log.warning("mmap_cleanup", "Could not remove memory-mapped output file", path=path, error=str(error))
+
+def _retry_removals():
+    """Retries the queued backing-file removals once; the mappings they belonged to are released by now."""
+    with _pending_lock:
+        paths = list(_PENDING_REMOVALS); _PENDING_REMOVALS.clear()
+    for path in paths: _remove_backing_file(path, retry=False)
+
+atexit.register(_retry_removals)
+
+def allocate_output(shape, device, mmap_dir=""):
+    """
+    Allocates a float32 output batch, optionally backed by a memory-mapped file so it can exceed RAM.
+    
+    Args:
+        shape (tuple): Output shape.
+        device (torch.device): Device for in-memory outputs; memory-mapped outputs always live on the CPU.
+        mmap_dir (str): Directory for the backing file; empty for a regular allocation. The file is deleted
+            right away on POSIX and once the output is freed on Windows.
+        
+    Returns:
+        torch.Tensor: The uninitialized output.
+    """
+    if not mmap_dir:
+        return torch.empty(shape, dtype=torch.float32, device=device)
+    _retry_removals()
+    os.makedirs(mmap_dir, exist_ok=True)
+    handle, path = tempfile.mkstemp(prefix="comfysnap-", suffix=".f32", dir=mmap_dir)
+    os.close(handle)
+    mapped = np.memmap(path, dtype=np.float32, mode="w+", shape=tuple(shape))
+    try:
+        # On POSIX the mapping keeps the data alive after the file is unlinked
+        os.unlink(path)
+    except OSError:
+        # Windows refuses while the file is mapped: delete it once the output is freed. The memmap's finalizer
+        # runs just before its mapping is closed, so a failure there is retried later.
+        weakref.finalize(mapped, _remove_backing_file, path)
+    return torch.from_numpy(mapped)
+
+def process_in_chunks(batch_size, frame_shape, device, process, chunk_size=0, max_memory_mb=0, mmap_dir="", work_factor=4):
+    """
+    Runs a per-chunk function over a batch and gathers the results in one preallocated output.
+    
+    Args:
+        batch_size (int): Number of frames.
+        frame_shape (tuple): Shape of one output frame, e.g. (H, W, 3).
+        device (torch.device): Device of the output.
+        process (callable): process(start, end, out) returns the (end - start, *frame_shape) result for
+            those frames. out is the matching slice of the output, which process may write into and
+            return, or None when the whole batch is a single chunk and no output was preallocated.
+        chunk_size, max_memory_mb, work_factor: See resolve_chunk_size().
+        mmap_dir (str): See allocate_output().
+        
+    Returns:
+        torch.Tensor: The (batch_size, *frame_shape) output.
+    """
+    frame_bytes = 4 * int(np.prod(frame_shape))
+    chunk = resolve_chunk_size(batch_size, frame_bytes, chunk_size, max_memory_mb, work_factor)
+    if chunk >= batch_size and not mmap_dir:
+        return process(0, batch_size, None)
+    output = allocate_output((batch_size,) + tuple(frame_shape), device, mmap_dir)
+    for start in range(0, batch_size, chunk):
+        end = min(batch_size, start + chunk)
+        target = output[start:end]
+        result = process(start, end, target)
+        if result is not target:
+            target.copy_(result)
+    return output
+
+def tensor_fingerprint(tensor, samples=1024):
+    """
+    A cheap content fingerprint of a tensor: its shape, dtype and device, a hash of up to `samples`
+    evenly spaced elements, and one float32 sum per frame (so small local edits such as an overlay
+    still change it). Costs one read of the tensor and a tiny host copy.
+    
+    Args:
+        tensor (torch.Tensor): Tensor on any device; the first dimension is treated as the frame axis.
+        samples (int): Number of elements hashed directly.
+        
+    Returns:
+        tuple: A hashable fingerprint.
+    """
+    data = tensor.detach()
+    digest = hashlib.blake2b(digest_size=16)
+    if data.numel() > 0:
+        flat = data.reshape(-1)
+        sampled = flat[::max(1, flat.numel() // samples)][:samples]
+        frames = data.reshape(data.shape[0], -1) if data.dim() > 1 else flat.view(1, -1)
+        digest.update(sampled.to(torch.float64).cpu().numpy().tobytes())
+        digest.update(frames.sum(dim=1, dtype=torch.float32).cpu().numpy().tobytes())
+    return (tuple(data.shape), str(data.dtype), str(data.device), digest.hexdigest())
+
+def _freeze(value):
+    # Hashable stand-in for a node argument: tensors by fingerprint, lists and dicts by content
+    if isinstance(value, torch.Tensor):
+        return tensor_fingerprint(value)
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+def _result_nbytes(result):
+    if isinstance(result, torch.Tensor):
+        return result.element_size() * result.numel()
+    if isinstance(result, (list, tuple)):
+        return sum(_result_nbytes(r) for r in result)
+    return 0
+
+# Process-wide cache of node results for use_result_cache, bounded by COMFYSNAP_RESULT_CACHE_MB (default 1024)
+RESULT_CACHE = LRUCache(max_entries=64, max_bytes=int(os.environ.get("COMFYSNAP_RESULT_CACHE_MB", "1024")) * 1024 * 1024,
+                        sizeof=_result_nbytes)
+_MISSING = object()
+
+def result_cached(method):
+    """
+    Decorator for a node's execute() adding an opt-in `use_result_cache` keyword.
+    
+    With use_result_cache=True, results are memoized in RESULT_CACHE under the node class and every
+    argument, with tensors keyed by tensor_fingerprint(). Cached outputs are shared between calls,
+    so callers must not modify them in place. Calls that belong to a stream (a non-empty stream_id)
+    depend on the stream's state and are never cached. ComfyUI's unique_id is not part of the key,
+    so nodes with the same inputs share results.
+    """
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, use_result_cache=False, **kwargs):
+        if not use_result_cache or kwargs.get("stream_id"):
+            return method(self, *args, **kwargs)
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        key = (type(self).__name__,) + tuple((name, _freeze(value)) for name, value in bound.arguments.items() if name not in ("self", "unique_id"))
+        result = RESULT_CACHE.get(key, _MISSING)
+        if result is _MISSING:
+            result = method(self, *args, **kwargs)
+            RESULT_CACHE.put(key, result)
+        return result
+    return wrapper
+
+def result_cache_stats():
+    """Returns the RESULT_CACHE counters (see LRUCache.stats())."""
+    return RESULT_CACHE.stats()